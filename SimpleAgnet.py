@@ -1,18 +1,28 @@
 from llm.base_model import LanguageModel
 from memory.memory import Memory
 from tool.base_tool import Tool
+from tool.process_pool import ToolProcessPool, WorkerTimeoutError
+from tool.registry import ToolRegistry
+from tool.result_cache import ToolResultCache
 from callback.callback import CallbackHandler
-from rag.rag import RAG
+from agent.plan import ToolPlan
+from agent.router import Router
+from agent.speculative import AsyncSpeculativeResponse, SpeculativeResponse, SpeculativeStats
 from tool.Calculator import Calculator
 from tool.Weather import Weather
 import re
-from typing import Dict, TypeVar, Any, Optional, Union, List
-from functools import lru_cache
+import asyncio
+from typing import TYPE_CHECKING, Dict, TypeVar, Any, Optional, Union, List, Iterator, Mapping
+from functools import partial
 import json
 from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from datetime import datetime
 import logging
+import threading
+import time
 
+if TYPE_CHECKING:
+    from rag.rag import RAG
 
 
 # 设置日志
@@ -25,25 +35,67 @@ class ToolExecutionError(Exception):
     """工具执行错误"""
     pass
 
+class ToolTimeoutError(ToolExecutionError):
+    """工具执行超时"""
+    pass
+
 class SimpleAgent:
     """一个简单的智能代理，能够使用工具、记忆对话和检索增强生成"""
+
+    DISPATCH_MODES = ("json", "function_call")
+    SPECULATION_WORKERS = 2  # 同时进行的推测生成数上限
     
-    def __init__(self, name: str, llm_model: str = "DeepSeek-R1"):
+    def __init__(self, name: str, llm_model: str = "DeepSeek-R1", dispatch_mode: str = "json",
+                 router: Optional[Router] = None, speculative: bool = False,
+                 tool_cache: Optional[ToolResultCache] = None,
+                 process_pool: Optional[ToolProcessPool] = None):
         """
         初始化智能代理
         Args:
             name: 代理名称
             llm_model: 使用的语言模型名称
+            dispatch_mode: 工具选择方式，json为让模型返回JSON后解析，
+                function_call为使用chat API的function calling，一次请求完成工具选择和参数填写
+            router: 在LLM意图分析前执行的快速路由，默认使用各工具的route_patterns
+            speculative: 是否推测执行。开启后意图分析与直接回答同时开始，判定需要工具时
+                取消直接回答；只对json调度模式生效，效果见speculative_stats
+            tool_cache: 工具结果缓存，可在多个代理间共享；默认每个代理各自创建
+            process_pool: 工具进程池，设置后cpu_heavy工具在子进程中执行，超时或被取消时子进程被终止；
+                可在多个代理间共享，由调用方负责shutdown()
         """
+        if dispatch_mode not in self.DISPATCH_MODES:
+            raise ValueError(f"不支持的调度模式: {dispatch_mode}，可选 {self.DISPATCH_MODES}")
         self.name = name
-        self.language_model = LanguageModel(llm_model)
-        self.memory = Memory()
+        self.dispatch_mode = dispatch_mode
         self.callback = CallbackHandler(name="AgentCallback")
-        self.rag_agent = RAG()
-        self._tools: Dict[str, Tool] = {}
+        self.language_model = LanguageModel(llm_model, callback=self.callback)
+        self.memory = Memory()
+        self._rag_agent: Optional["RAG"] = None  # RAG依赖较重，首次使用时再创建
+        self._init_lock = threading.Lock()
+        self.tool_registry = ToolRegistry()
+        self.tool_cache = tool_cache if tool_cache is not None else ToolResultCache()
+        self.process_pool = process_pool
+        self.router = router or Router()
+        self.speculative = speculative
+        self.speculative_stats = SpeculativeStats()
         self._executor = ThreadPoolExecutor(max_workers=4)  # 工具执行线程池
+        # 推测生成使用独立的线程池，不占用工具执行和计划执行的线程；已满时不再推测
+        self._speculation_executor = ThreadPoolExecutor(max_workers=self.SPECULATION_WORKERS,
+                                                        thread_name_prefix="speculation")
+        self._speculation_slots = threading.BoundedSemaphore(self.SPECULATION_WORKERS)
         self._init_tools()
         
+    @property
+    def rag_agent(self) -> "RAG":
+        """RAG引擎，首次使用时创建并与代理共享同一个语言模型客户端"""
+        if self._rag_agent is None:
+            with self._init_lock:
+                if self._rag_agent is None:
+                    from rag.rag import RAG
+                    self._rag_agent = RAG(callback=self.callback,
+                                          language_model=self.language_model)
+        return self._rag_agent
+
     def greet(self) -> str:
         """发送欢迎消息"""
         greeting = f"你好，我是{self.name}，很高兴为你服务！"
@@ -63,23 +115,47 @@ class SimpleAgent:
         logger.info(f"开始处理RAG请求，文件: {file_path}")
         self.callback.on_rag_start(file_path, prompt)
         try:
-            self.rag_agent.load_document(file_path)
-            result = self.rag_agent.retrieve_and_generate(prompt)
+            doc_id = self.rag_agent.document_id(file_path)
+            # 加载到检索结束前固定该文档，避免并发加载的其他文档将其淘汰
+            with self.rag_agent.index_manager.pinned(doc_id):
+                self.rag_agent.load_document(file_path, doc_id=doc_id)
+                result = self.rag_agent.retrieve_and_generate(prompt, doc_ids=[doc_id])
+            self.callback.on_rag_end(result)
+            return result
+        except Exception as e:
+            logger.error(f"RAG处理失败: {str(e)}")
+            self.callback.on_rag_error(e)
+            return f"处理文档时出错: {str(e)}"
+
+    async def arag(self, file_path: str, prompt: str) -> str:
+        """rag的异步版本，文档解析在线程中执行，不阻塞事件循环"""
+        logger.info(f"开始处理RAG请求，文件: {file_path}")
+        self.callback.on_rag_start(file_path, prompt)
+        try:
+            doc_id = await asyncio.to_thread(self.rag_agent.document_id, file_path)
+            with self.rag_agent.index_manager.pinned(doc_id):
+                await asyncio.to_thread(self.rag_agent.load_document, file_path, doc_id=doc_id)
+                result = await self.rag_agent.aretrieve_and_generate(prompt, doc_ids=[doc_id])
             self.callback.on_rag_end(result)
             return result
         except Exception as e:
             logger.error(f"RAG处理失败: {str(e)}")
             self.callback.on_rag_error(e)
             return f"处理文档时出错: {str(e)}"
-    def generate_response(self, prompt: str, use_memory: bool = False) -> str:
+
+    def generate_response(self, prompt: str, use_memory: bool = False,
+                          stream: bool = False) -> Union[str, Iterator[str]]:
         """
         生成自然语言响应
         Args:
             prompt: 输入提示
             use_memory: 是否使用记忆
+            stream: 是否流式返回
         Returns:
-            生成的响应文本
+            生成的响应文本；stream为True时返回逐个产出文本片段的生成器
         """
+        if stream:
+            return self._stream_response(prompt, use_memory)
         self.callback.on_llm_start(prompt)
         try:
             # 如果需要，可以从记忆中获取上下文
@@ -87,7 +163,7 @@ class SimpleAgent:
             response = self.language_model.generate_text(prompt)
             
             if use_memory:
-                self.memory.save_history(prompt, response)
+                self.memory.save_history({"prompt": prompt, "response": response})
                 
             self.callback.on_llm_end(response)
             return response
@@ -95,19 +171,62 @@ class SimpleAgent:
             logger.error(f"生成响应失败: {str(e)}")
             self.callback.on_llm_error(e)
             return "抱歉，我无法生成回答。请稍后再试。"
+
+    def _stream_response(self, prompt: str, use_memory: bool = False) -> Iterator[str]:
+        """流式生成响应，每个片段触发on_llm_new_token回调"""
+        self.callback.on_llm_start(prompt)
+        parts = []
+        try:
+            for token in self.language_model.stream_text(prompt):
+                parts.append(token)
+                self.callback.on_llm_new_token(token)
+                yield token
+        except Exception as e:
+            logger.error(f"生成响应失败: {str(e)}")
+            self.callback.on_llm_error(e)
+            if not parts:
+                yield "抱歉，我无法生成回答。请稍后再试。"
+            return
+        response = "".join(parts)
+        if use_memory:
+            self.memory.save_history({"prompt": prompt, "response": response})
+        self.callback.on_llm_end(response)
+
+    async def agenerate_response(self, prompt: str, use_memory: bool = False) -> str:
+        """generate_response的异步版本"""
+        self.callback.on_llm_start(prompt)
+        try:
+            response = await self.language_model.agenerate_text(prompt)
+
+            if use_memory:
+                self.memory.save_history({"prompt": prompt, "response": response})
+
+            self.callback.on_llm_end(response)
+            return response
+        except Exception as e:
+            logger.error(f"生成响应失败: {str(e)}")
+            self.callback.on_llm_error(e)
+            return "抱歉，我无法生成回答。请稍后再试。"
     def _init_tools(self) -> None:
         """初始化默认工具集"""
         # 预加载核心工具
         self.register_tool("calculator", Calculator(), is_core=True)
         self.register_tool("weather", Weather(), is_core=True)
 
+    @property
+    def _tools(self) -> Mapping[str, Tool]:
+        """当前版本的只读工具表"""
+        return self.tool_registry.snapshot.tools
+
     @property
     def available_tools(self) -> Dict[str, str]:
         """获取可用工具清单（名称: 描述）"""
-        return {
-            name: tool.__doc__.split('\n')[0].strip() if tool.__doc__ else "无描述"
-            for name, tool in self._tools.items()
-        }
+        return self.tool_registry.snapshot.manifest
+
+    @property
+    def tool_schemas(self) -> List[Dict[str, Any]]:
+        """由已注册工具生成的function calling工具定义"""
+        return self.tool_registry.snapshot.schemas
 
     def register_tool(self, name: str, tool_instance: Tool, *, 
                      is_core: bool = False, overwrite: bool = False) -> None:
@@ -124,17 +243,12 @@ class SimpleAgent:
             ValueError: 当工具名已存在且不允许覆盖时
             TypeError: 当工具类型不正确时
         """
-        if not isinstance(tool_instance, Tool):
-            raise TypeError(f"工具必须继承自Tool类，获取 {type(tool_instance)}")
-            
-        if name in self._tools and not overwrite:
-            if self._tools[name]._is_core and not is_core:
-                raise ValueError(f"核心工具 {name} 不能被非核心版本覆盖")
-            raise ValueError(f"工具 {name} 已存在，使用 overwrite=True 强制覆盖")
-            
-        tool_instance._is_core = is_core
-        self._tools[name] = tool_instance
-        logger.info(f"注册工具: {name} (核心: {is_core})")
+        snapshot = self.tool_registry.register(name, tool_instance, is_core=is_core, overwrite=overwrite)
+        self.tool_cache.invalidate(name)
+        self.router.remove_route(name)
+        for pattern in tool_instance.route_patterns:
+            self.router.add_rule(name, pattern)
+        logger.info(f"注册工具: {name} (核心: {is_core}, 注册表版本: {snapshot.version})")
         
     def unregister_tool(self, name: str) -> bool:
         """
@@ -149,20 +263,16 @@ class SimpleAgent:
         Raises:
             ValueError: 当尝试卸载核心工具时
         """
-        if name not in self._tools:
+        if not self.tool_registry.unregister(name):
             return False
-            
-        if self._tools[name]._is_core:
-            raise ValueError(f"不能卸载核心工具 {name}")
-            
-        del self._tools[name]
+        self.tool_cache.invalidate(name)
+        self.router.remove_route(name)
         logger.info(f"已卸载工具: {name}")
         return True
         
-    @lru_cache(maxsize=32)
     def get_tool(self, name: str, tool_type: Optional[type[T]] = None) -> T:
         """
-        安全获取工具实例
+        安全获取工具实例，读取注册表当前快照，无需加锁
         Args:
             name: 工具名
             tool_type: 期望的工具类型  
@@ -171,18 +281,9 @@ class SimpleAgent:
         Raises:
             ValueError: 当工具不存在或类型不匹配时
         """
-        if name not in self._tools:
-            raise ValueError(
-                f"工具 {name} 未注册。可用工具: {list(self._tools.keys())}"
-            ) 
-        tool = self._tools[name]
-        
-        if tool_type and not isinstance(tool, tool_type):
-            raise ValueError(
-                f"工具 {name} 类型不符，期望 {tool_type} 但获取 {type(tool)}")  
-                
-        return tool
-    def tool_use(self, tool_name: str, params: Union[str, dict], *args, **kwargs) -> Any: 
+        return self.tool_registry.get(name, tool_type)
+    def tool_use(self, tool_name: str, params: Union[str, dict], *args,
+                 timeout: Optional[float] = None, **kwargs) -> Any: 
         """
         安全执行工具调用
         
@@ -190,50 +291,247 @@ class SimpleAgent:
             tool_name: 工具名称
             params: 工具参数(可以是字符串或字典)
             *args: 工具位置参数
+            timeout: 超时时间（秒），默认使用工具的timeout属性
             **kwargs: 工具关键字参数   
         Returns:
             工具执行结果   
             
         Raises:
             ToolExecutionError: 工具执行失败时
-            TimeoutError: 工具执行超时时
+            ToolTimeoutError: 工具执行超时时
+        """
+        hit, result = self._cached_tool_result(tool_name, params)
+        if hit:
+            return result
+        timeout = timeout if timeout is not None else self._tool_timeout(tool_name)
+        if self._isolated(self._tools.get(tool_name)):
+            # 进程池到时终止子进程，调用线程只等待管道，无需再经过线程池
+            return self._run_tool(tool_name, params, False, timeout)
+        future = self._executor.submit(self._run_tool, tool_name, params, False)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            # 未开始的任务会被撤销；已在运行的线程无法强制终止，其结果将被忽略
+            future.cancel()
+            return self._tool_timed_out(tool_name, timeout)
+
+    def _isolated(self, tool: Optional[Tool]) -> bool:
+        """工具是否在进程池中隔离执行"""
+        return self.process_pool is not None and tool is not None and tool.cpu_heavy
+
+    def _tool_timeout(self, tool_name: str) -> Optional[float]:
+        try:
+            return self.get_tool(tool_name).timeout
+        except ValueError:
+            return None
+
+    def _tool_timed_out(self, tool_name: str, timeout: Optional[float]):
+        error = ToolTimeoutError(f"工具 {tool_name} 执行超时（{timeout}秒）")
+        logger.error(str(error))
+        self.callback.on_tool_error(tool_name, error)
+        raise error
+
+    @staticmethod
+    def _parse_params(params: Union[str, dict]) -> Any:
+        # 如果参数是字符串，尝试解析为字典
+        if isinstance(params, str):
+            try:
+                params = json.loads(params)
+            except json.JSONDecodeError:
+                # 如果不是JSON，作为单一参数处理
+                params =params
+        return params
+
+    def _tool_cache_key(self, tool: Tool, tool_name: str, params: Any) -> Optional[tuple]:
+        """可缓存工具的结果缓存key，不可缓存或参数无法规范化时返回None"""
+        if tool.cache_policy == "never":
+            return None
+        try:
+            return self.tool_cache.make_key(tool_name, tool.normalize_params(params), tool.instance_id)
+        except Exception as e:
+            logger.warning(f"工具 {tool_name} 参数规范化失败，不使用缓存: {str(e)}")
+            return None
+
+    def _cached_tool_result(self, tool_name: str, params: Union[str, dict]) -> tuple:
+        """
+        查询工具结果缓存，命中时以cached=True触发工具回调
+        Returns:
+            (是否命中, 结果)
+        """
+        try:
+            tool = self.get_tool(tool_name)
+        except ValueError:
+            return False, None
+        key = self._tool_cache_key(tool, tool_name, self._parse_params(params))
+        if key is None:
+            return False, None
+        hit, result = self.tool_cache.get(key)
+        if hit:
+            logger.info(f"工具 {tool_name} 命中结果缓存")
+            self.callback.on_tool_start(tool_name, params, cached=True)
+            self.callback.on_tool_end(tool_name, result, cached=True)
+        return hit, result
+
+    def _run_tool(self, tool_name: str, params: Union[str, dict], check_cache: bool = True,
+                  timeout: Optional[float] = None) -> Any:
+        """
+        在当前线程执行工具并触发回调，可缓存工具的结果写入结果缓存
+        cpu_heavy工具在配置了进程池时于子进程中执行，timeout（默认为工具的timeout属性）到时终止子进程
         """
+        if check_cache:
+            hit, result = self._cached_tool_result(tool_name, params)
+            if hit:
+                return result
         try:
             tool = self.get_tool(tool_name)
             self.callback.on_tool_start(tool_name, params)
-            # 如果参数是字符串，尝试解析为字典
-            if isinstance(params, str):
-                try:
-                    params = json.loads(params)
-                except json.JSONDecodeError:
-                    # 如果不是JSON，作为单一参数处理
-                    params =params
+            params = self._parse_params(params)
             
-            # 执行工具（带超时控制）
-            result = tool.use(params)
+            if self._isolated(tool):
+                timeout = timeout if timeout is not None else tool.timeout
+                result = self.process_pool.run(tool, params, timeout)
+            else:
+                result = tool.use(params)
             
+            self._store_tool_result(tool, tool_name, params, result)
             self.callback.on_tool_end(tool_name, result)
             return result
             
+        except WorkerTimeoutError:
+            return self._tool_timed_out(tool_name, timeout)
         except Exception as e:
             logger.error(f"工具 {tool_name} 执行失败: {str(e)}", exc_info=True)
             self.callback.on_tool_error(tool_name, e)
             raise ToolExecutionError(f"工具 {tool_name} 执行失败: {str(e)}")
+
+    def _store_tool_result(self, tool: Tool, tool_name: str, params: Any, result: Any) -> None:
+        if not tool.cacheable(result):
+            return
+        key = self._tool_cache_key(tool, tool_name, params)
+        if key is not None:
+            self.tool_cache.put(key, result, tool.cache_ttl if tool.cache_policy == "ttl" else None)
+
+    async def _arun_tool(self, tool_name: str, params: Union[str, dict], check_cache: bool = True,
+                         timeout: Optional[float] = None) -> Any:
+        """
+        _run_tool的异步版本，原生支持异步的工具直接在事件循环中执行，隔离执行的工具在进程池中执行
+        （timeout到时或任务被取消时终止子进程），其余工具在线程池中执行
+        """
+        tool = self._tools.get(tool_name)
+        isolated = self._isolated(tool)
+        if tool is None or not (tool.supports_async or isolated):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, self._run_tool, tool_name, params, check_cache,
+                                              timeout)
+        if check_cache:
+            hit, result = self._cached_tool_result(tool_name, params)
+            if hit:
+                return result
+        try:
+            self.callback.on_tool_start(tool_name, params)
+            params = self._parse_params(params)
+            if isolated:
+                timeout = timeout if timeout is not None else tool.timeout
+                result = await self.process_pool.arun(tool, params, timeout)
+            else:
+                result = await tool.ause(params)
+            self._store_tool_result(tool, tool_name, params, result)
+            self.callback.on_tool_end(tool_name, result)
+            return result
+        except WorkerTimeoutError:
+            return self._tool_timed_out(tool_name, timeout)
+        except Exception as e:
+            logger.error(f"工具 {tool_name} 执行失败: {str(e)}", exc_info=True)
+            self.callback.on_tool_error(tool_name, e)
+            raise ToolExecutionError(f"工具 {tool_name} 执行失败: {str(e)}")
+
+    async def atool_use(self, tool_name: str, params: Union[str, dict], *args,
+                        timeout: Optional[float] = None, **kwargs) -> Any:
+        """tool_use的异步版本，支持异步的工具在事件循环中执行，其余工具在代理的线程池中执行"""
+        hit, result = self._cached_tool_result(tool_name, params)
+        if hit:
+            return result
+        timeout = timeout if timeout is not None else self._tool_timeout(tool_name)
+        try:
+            return await asyncio.wait_for(self._arun_tool(tool_name, params, False, timeout), timeout)
+        except asyncio.TimeoutError:
+            return self._tool_timed_out(tool_name, timeout)
+
+    def run_plan(self, steps: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """
+        执行多工具计划，相互独立的步骤在线程池中并发执行，依赖步骤按DAG顺序执行
+        Args:
+            steps: 步骤列表，格式见ToolPlan
+        Returns:
+            每个步骤的执行结果
+        Raises:
+            ToolExecutionError: 计划无效时
+        """
+        plan = self._build_plan(steps)
+        logger.info(f"执行计划，共 {len(plan.steps)} 个步骤: {plan.tools}")
+        return self._report_timeouts(plan.execute(self._run_tool, self._executor, self._tool_timeout))
+
+    async def arun_plan(self, steps: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """run_plan的异步版本"""
+        plan = self._build_plan(steps)
+        logger.info(f"执行计划，共 {len(plan.steps)} 个步骤: {plan.tools}")
+        return self._report_timeouts(await plan.aexecute(self._arun_tool, self._tool_timeout))
+
+    def _report_timeouts(self, outcomes: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        for outcome in outcomes.values():
+            if outcome["status"] == "timeout":
+                self.callback.on_tool_error(
+                    outcome["tool"], ToolTimeoutError(f"步骤 {outcome['id']} 执行超时"))
+        return outcomes
+
+    def _build_plan(self, steps: List[Dict[str, Any]]) -> ToolPlan:
+        try:
+            plan = ToolPlan(steps)
+        except (ValueError, TypeError, AttributeError) as e:
+            raise ToolExecutionError(f"无效的执行计划: {str(e)}")
+        unknown = [tool for tool in plan.tools if tool not in self._tools]
+        if unknown:
+            raise ToolExecutionError(f"计划中包含未注册的工具: {unknown}")
+        return plan
         
-    def llm_tool_dispatcher(self, prompt: str, file_path: Optional[str] = None) -> str:
+    def llm_tool_dispatcher(self, prompt: str, file_path: Optional[str] = None,
+                            stream: bool = False, llm_format: bool = False) -> Union[str, Iterator[str]]:
         """
         主调度方法，根据用户输入决定使用工具或直接响应
         Args:
             prompt: 用户输入
+            file_path: 文档路径，提供时使用RAG回答
+            stream: 是否流式返回
+            llm_format: 为True时即使工具声明了本地格式化器也由LLM格式化结果
         Returns:
-            生成的响应文本
+            生成的响应文本；stream为True时返回逐个产出文本片段的生成器
         """
+        if stream:
+            return self._stream_dispatch(prompt, file_path, llm_format)
         logger.info(f"用户输入: {prompt}")
         if file_path :
             return self.rag(file_path, prompt)
-        tool_choice = self._llm_analyze_intent(prompt)
+        speculation = None
+        tool_choice = self._fast_route(prompt)
+        if not tool_choice:
+            speculation = self._start_speculation(prompt)
+            tool_choice = self._llm_select_tool(prompt)
+        decided_at = time.perf_counter()
         if not tool_choice or tool_choice["action"] == "direct_response":
+            if tool_choice and tool_choice.get("response"):
+                return tool_choice["response"]
+            if speculation is not None:
+                return self._finish_speculation(speculation, prompt, decided_at)
             return self.generate_response(prompt)
+        if speculation is not None:
+            speculation.cancel()
+        if tool_choice["action"] == "plan":
+            try:
+                outcomes = self.run_plan(tool_choice["steps"])
+            except ToolExecutionError as e:
+                logger.error(f"计划执行失败: {str(e)}")
+                return self.generate_response(f"用户问题: {prompt}\n工具执行失败: {str(e)}\n请直接回答用户问题")
+            return self._format_plan_result(outcomes, prompt, llm_format)
         try:
             result = self.tool_use(
                 tool_name=tool_choice["tool"],
@@ -242,12 +540,246 @@ class SimpleAgent:
             return self._format_tool_result(
                 tool_name=tool_choice["tool"],
                 result=result,
-                original_query=prompt
+                original_query=prompt,
+                params=tool_choice["params"],
+                llm_format=llm_format
             ) 
         except ToolExecutionError as e:
             logger.error(f"工具调度失败: {str(e)}")
             # 失败时尝试直接回答
             return self.generate_response(f"用户问题: {prompt}\n工具执行失败: {str(e)}\n请直接回答用户问题")  
+
+    def _stream_dispatch(self, prompt: str, file_path: Optional[str] = None,
+                         llm_format: bool = False) -> Iterator[str]:
+        """
+        流式调度：意图分析需要完整JSON，不做流式；
+        最终面向用户的回复（直接回答或工具结果格式化）逐片段产出
+        """
+        logger.info(f"用户输入: {prompt}")
+        if file_path:
+            yield self.rag(file_path, prompt)
+            return
+        tool_choice = self._select_tool(prompt)
+        if not tool_choice or tool_choice["action"] == "direct_response":
+            if tool_choice and tool_choice.get("response"):
+                # function calling模式下模型已在选择工具的同一请求中给出回答
+                yield tool_choice["response"]
+                return
+            yield from self._stream_response(prompt)
+            return
+        if tool_choice["action"] == "plan":
+            try:
+                outcomes = self.run_plan(tool_choice["steps"])
+            except ToolExecutionError as e:
+                logger.error(f"计划执行失败: {str(e)}")
+                yield from self._stream_response(f"用户问题: {prompt}\n工具执行失败: {str(e)}\n请直接回答用户问题")
+                return
+            local = None if llm_format else self._plan_local_format(outcomes, prompt)
+            if local is not None:
+                yield local
+                return
+            yield from self._stream_response(self._build_plan_format_prompt(outcomes, prompt))
+            return
+        try:
+            result = self.tool_use(
+                tool_name=tool_choice["tool"],
+                params=tool_choice["params"]
+            )
+        except ToolExecutionError as e:
+            logger.error(f"工具调度失败: {str(e)}")
+            yield from self._stream_response(f"用户问题: {prompt}\n工具执行失败: {str(e)}\n请直接回答用户问题")
+            return
+        local = None if llm_format else self._local_format(
+            tool_choice["tool"], result, prompt, tool_choice["params"])
+        if local is not None:
+            yield local
+            return
+        logger.info(f"格式化工具 {tool_choice['tool']} 的结果")
+        yield from self._stream_response(
+            self._build_format_prompt(tool_choice["tool"], result, prompt)
+        )
+
+    async def allm_tool_dispatcher(self, prompt: str, file_path: Optional[str] = None,
+                                   llm_format: bool = False) -> str:
+        """
+        llm_tool_dispatcher的异步版本
+        单个事件循环即可并发处理大量会话，等待LLM时不占用线程
+        """
+        logger.info(f"用户输入: {prompt}")
+        if file_path:
+            return await self.arag(file_path, prompt)
+        speculation = None
+        tool_choice = self._fast_route(prompt)
+        if not tool_choice:
+            speculation = self._astart_speculation(prompt)
+            tool_choice = await self._allm_select_tool(prompt)
+        decided_at = time.perf_counter()
+        if not tool_choice or tool_choice["action"] == "direct_response":
+            if tool_choice and tool_choice.get("response"):
+                return tool_choice["response"]
+            if speculation is not None:
+                return await self._afinish_speculation(speculation, prompt, decided_at)
+            return await self.agenerate_response(prompt)
+        if speculation is not None:
+            speculation.cancel()
+        if tool_choice["action"] == "plan":
+            try:
+                outcomes = await self.arun_plan(tool_choice["steps"])
+            except ToolExecutionError as e:
+                logger.error(f"计划执行失败: {str(e)}")
+                return await self.agenerate_response(f"用户问题: {prompt}\n工具执行失败: {str(e)}\n请直接回答用户问题")
+            return await self._aformat_plan_result(outcomes, prompt, llm_format)
+        try:
+            result = await self.atool_use(
+                tool_name=tool_choice["tool"],
+                params=tool_choice["params"]
+            )
+            return await self._aformat_tool_result(
+                tool_name=tool_choice["tool"],
+                result=result,
+                original_query=prompt,
+                params=tool_choice["params"],
+                llm_format=llm_format
+            )
+        except ToolExecutionError as e:
+            logger.error(f"工具调度失败: {str(e)}")
+            return await self.agenerate_response(f"用户问题: {prompt}\n工具执行失败: {str(e)}\n请直接回答用户问题")
+
+    def _select_tool(self, prompt: str) -> Optional[Dict[str, Any]]:
+        """先尝试快速路由，未命中时按调度模式由LLM选择工具"""
+        return self._fast_route(prompt) or self._llm_select_tool(prompt)
+
+    async def _aselect_tool(self, prompt: str) -> Optional[Dict[str, Any]]:
+        """_select_tool的异步版本"""
+        return self._fast_route(prompt) or await self._allm_select_tool(prompt)
+
+    def _llm_select_tool(self, prompt: str) -> Optional[Dict[str, Any]]:
+        """按调度模式由LLM选择工具"""
+        if self.dispatch_mode == "function_call":
+            return self._llm_call_function(prompt)
+        return self._llm_analyze_intent(prompt)
+
+    async def _allm_select_tool(self, prompt: str) -> Optional[Dict[str, Any]]:
+        """_llm_select_tool的异步版本"""
+        if self.dispatch_mode == "function_call":
+            return await self._allm_call_function(prompt)
+        return await self._allm_analyze_intent(prompt)
+
+    def _start_speculation(self, prompt: str) -> Optional[SpeculativeResponse]:
+        """开启推测执行时，在独立的线程池中提前生成直接回答；推测线程都在使用时不推测"""
+        if not self.speculative or self.dispatch_mode != "json":
+            return None
+        if not self._speculation_slots.acquire(blocking=False):
+            logger.info("推测线程已满，本次不推测执行")
+            return None
+        logger.info("推测执行：与意图分析同时生成直接回答")
+        try:
+            speculation = SpeculativeResponse(prompt, partial(self.language_model.stream_text, prompt),
+                                              self._speculation_executor, self.speculative_stats)
+        except BaseException:
+            self._speculation_slots.release()
+            raise
+        speculation.add_done_callback(self._speculation_slots.release)
+        return speculation
+
+    def _astart_speculation(self, prompt: str) -> Optional[AsyncSpeculativeResponse]:
+        """_start_speculation的异步版本，生成在事件循环的任务中进行"""
+        if not self.speculative or self.dispatch_mode != "json":
+            return None
+        logger.info("推测执行：与意图分析同时生成直接回答")
+        return AsyncSpeculativeResponse(prompt, partial(self.language_model.astream_text, prompt),
+                                        self.speculative_stats)
+
+    def _finish_speculation(self, speculation: SpeculativeResponse, prompt: str,
+                            decided_at: float) -> str:
+        """采用推测生成的直接回答，推测生成失败时重新生成"""
+        self.callback.on_llm_start(prompt)
+        try:
+            response = speculation.result(decided_at)
+        except Exception as e:
+            logger.warning(f"推测生成失败，重新生成回答: {str(e)}")
+            return self.generate_response(prompt)
+        self.callback.on_llm_end(response)
+        return response
+
+    async def _afinish_speculation(self, speculation: AsyncSpeculativeResponse, prompt: str,
+                                   decided_at: float) -> str:
+        """_finish_speculation的异步版本"""
+        self.callback.on_llm_start(prompt)
+        try:
+            response = await speculation.result(decided_at)
+        except Exception as e:
+            logger.warning(f"推测生成失败，重新生成回答: {str(e)}")
+            return await self.agenerate_response(prompt)
+        self.callback.on_llm_end(response)
+        return response
+
+    def _fast_route(self, prompt: str) -> Optional[Dict[str, Any]]:
+        """本地规则/分类器路由，命中的工具不在路由表中时视为未命中"""
+        tool_choice = self.router.route(prompt)
+        if not tool_choice:
+            return None
+        if tool_choice["tool"] is not None and tool_choice["tool"] not in self._tools:
+            logger.warning(f"快速路由选择了未注册的工具: {tool_choice['tool']}")
+            return None
+        logger.info(f"快速路由命中: {tool_choice['route']}，跳过LLM意图分析")
+        return tool_choice
+
+    def _llm_call_function(self, prompt: str) -> Optional[Dict[str, Any]]:
+        """
+        使用function calling选择工具，模型不调用工具时其回复即为最终回答
+        
+        Args:
+            prompt: 用户输入
+            
+        Returns:
+            与_llm_analyze_intent相同结构的字典，直接回答时额外包含response；失败时返回None
+        """
+        logger.info("通过function calling选择工具...")
+        self.callback.on_llm_start(prompt)
+        try:
+            message = self.language_model.generate_with_tools(prompt, self.tool_schemas)
+        except Exception as e:
+            logger.error(f"function calling请求失败: {str(e)}")
+            self.callback.on_llm_error(e)
+            return None
+        self.callback.on_llm_end(json.dumps(message, ensure_ascii=False))
+        return self._parse_tool_call(message)
+
+    async def _allm_call_function(self, prompt: str) -> Optional[Dict[str, Any]]:
+        """_llm_call_function的异步版本"""
+        logger.info("通过function calling选择工具...")
+        self.callback.on_llm_start(prompt)
+        try:
+            message = await self.language_model.agenerate_with_tools(prompt, self.tool_schemas)
+        except Exception as e:
+            logger.error(f"function calling请求失败: {str(e)}")
+            self.callback.on_llm_error(e)
+            return None
+        self.callback.on_llm_end(json.dumps(message, ensure_ascii=False))
+        return self._parse_tool_call(message)
+
+    def _parse_tool_call(self, message: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """把function calling的结果转为工具选择字典，多个工具调用转为并发执行的计划"""
+        if not message["tool_calls"]:
+            return {"tool": None, "action": "direct_response", "params": None,
+                    "response": message["content"]}
+        steps = []
+        for i, call in enumerate(message["tool_calls"], 1):
+            tool = self._tools.get(call["name"])
+            if tool is None:
+                logger.warning(f"模型选择了未注册的工具: {call['name']}")
+                return None
+            try:
+                arguments = json.loads(call["arguments"] or "{}")
+            except json.JSONDecodeError as e:
+                logger.warning(f"解析工具参数失败: {str(e)}")
+                return None
+            steps.append({"id": f"t{i}", "tool": call["name"], "params": tool.from_arguments(arguments)})
+        if len(steps) > 1:
+            return {"tool": None, "action": "plan", "params": None, "steps": steps}
+        return {"tool": steps[0]["tool"], "action": "use", "params": steps[0]["params"]}
+
     def _llm_analyze_intent(self, prompt: str) -> Optional[Dict[str, Any]]:
         """
         使用LLM分析用户意图，决定是否使用工具
@@ -259,10 +791,18 @@ class SimpleAgent:
             包含工具选择信息的字典，或None
         """
         logger.info("分析用户意图...")
-        tools_list = "\n".join(
-            f"- {name}: {tool.__doc__.splitlines()[0] if tool.__doc__ else '无描述'}"
-            for name, tool in self._tools.items()
-        )
+        response = self.generate_response(self._build_intent_prompt(prompt), use_memory=False)
+        return self._parse_intent(response)
+
+    async def _allm_analyze_intent(self, prompt: str) -> Optional[Dict[str, Any]]:
+        """_llm_analyze_intent的异步版本"""
+        logger.info("分析用户意图...")
+        response = await self.agenerate_response(self._build_intent_prompt(prompt), use_memory=False)
+        return self._parse_intent(response)
+
+    def _build_intent_prompt(self, prompt: str) -> str:
+        """构造意图分析的prompt"""
+        tools_list = self.tool_registry.snapshot.prompt_fragment
         prompt_template = f"""
         请分析用户意图并选择操作。可用工具：
         {tools_list}
@@ -271,26 +811,36 @@ class SimpleAgent:
         请返回严格的JSON格式：
         {{
             "tool": "工具名" | null,
-            "action": "use" | "direct_response",
+            "action": "use" | "direct_response" | "plan",
             "params": "参数" | null,
+            "steps": null
         }}
+        需要调用多个工具时（例如同时查询多个城市的天气），action为"plan"，并在steps中列出每次调用：
+        [{{"id": "t1", "tool": "工具名", "params": "参数", "depends_on": []}}, ...]
+        某一步需要用到前面步骤的结果时，在params中用{{{{t1}}}}引用，并在depends_on中写明
         """
-        response = self.generate_response(prompt_template, use_memory=False)
-        
+        return prompt_template
+
+    def _parse_intent(self, response: str) -> Optional[Dict[str, Any]]:
+        """从LLM回复中提取意图JSON"""
         try:
             # 更健壮的JSON提取
             json_str = re.search(r'\{.*\}', response, re.DOTALL)
             if json_str:
                 result = json.loads(json_str.group())
                 # 验证结果结构
-                if all(key in result for key in ["tool", "action", "params"]):
+                if result.get("action") == "plan":
+                    if isinstance(result.get("steps"), list) and result["steps"]:
+                        return result
+                elif all(key in result for key in ["tool", "action", "params"]):
                     return result
         except (json.JSONDecodeError, AttributeError) as e:
             logger.warning(f"解析意图失败: {str(e)}")
             
         return None 
     def _format_tool_result(self, tool_name: str, result: Any, 
-                          original_query: str) -> str:
+                          original_query: str, params: Any = None,
+                          llm_format: bool = False) -> str:
         """
         将工具执行结果格式化为自然语言回复
         
@@ -298,18 +848,88 @@ class SimpleAgent:
             tool_name: 工具名称
             result: 工具执行结果
             original_query: 原始问题
+            params: 工具参数
+            llm_format: 是否强制使用LLM格式化
         Returns:
             格式化的自然语言回复
         """
+        local = None if llm_format else self._local_format(tool_name, result, original_query, params)
+        if local is not None:
+            return local
         logger.info(f"格式化工具 {tool_name} 的结果")
-        prompt = f"""
+        return self.generate_response(self._build_format_prompt(tool_name, result, original_query))
+
+    async def _aformat_tool_result(self, tool_name: str, result: Any,
+                                   original_query: str, params: Any = None,
+                                   llm_format: bool = False) -> str:
+        """_format_tool_result的异步版本"""
+        local = None if llm_format else self._local_format(tool_name, result, original_query, params)
+        if local is not None:
+            return local
+        logger.info(f"格式化工具 {tool_name} 的结果")
+        return await self.agenerate_response(self._build_format_prompt(tool_name, result, original_query))
+
+    def _format_plan_result(self, outcomes: Dict[str, Dict[str, Any]], original_query: str,
+                            llm_format: bool = False) -> str:
+        """将计划各步骤的结果合并格式化为一个回复，所有步骤都有本地格式化器时不调用LLM"""
+        local = None if llm_format else self._plan_local_format(outcomes, original_query)
+        if local is not None:
+            return local
+        return self.generate_response(self._build_plan_format_prompt(outcomes, original_query))
+
+    async def _aformat_plan_result(self, outcomes: Dict[str, Dict[str, Any]], original_query: str,
+                                   llm_format: bool = False) -> str:
+        """_format_plan_result的异步版本"""
+        local = None if llm_format else self._plan_local_format(outcomes, original_query)
+        if local is not None:
+            return local
+        return await self.agenerate_response(self._build_plan_format_prompt(outcomes, original_query))
+
+    def _plan_local_format(self, outcomes: Dict[str, Dict[str, Any]],
+                           original_query: str) -> Optional[str]:
+        if any(outcome["status"] != "ok" for outcome in outcomes.values()):
+            return None
+        texts = []
+        for outcome in outcomes.values():
+            text = self._local_format(outcome["tool"], outcome["result"], original_query, outcome["params"])
+            if text is None:
+                return None
+            texts.append(text)
+        return "\n".join(texts)
+
+    def _build_plan_format_prompt(self, outcomes: Dict[str, Dict[str, Any]], original_query: str) -> str:
+        """把各步骤的结果汇总后复用单工具的格式化prompt"""
+        lines = []
+        for outcome in outcomes.values():
+            if outcome["status"] == "ok":
+                detail = str(outcome["result"])
+            else:
+                detail = f"失败（{outcome['status']}）: {outcome['error']}"
+            lines.append(f"{outcome['id']} {outcome['tool']}({outcome['params']}): {detail}")
+        tools = "、".join(dict.fromkeys(outcome["tool"] for outcome in outcomes.values()))
+        return self._build_format_prompt(tools, "\n" + "\n".join(lines), original_query)
+
+    def _local_format(self, tool_name: str, result: Any, original_query: str,
+                      params: Any = None) -> Optional[str]:
+        """使用工具声明的本地格式化器，未声明或格式化失败时返回None以回退到LLM"""
+        try:
+            text = self.get_tool(tool_name).format_result(result, original_query, params)
+        except Exception as e:
+            logger.warning(f"工具 {tool_name} 本地格式化失败，改用LLM: {str(e)}")
+            return None
+        if text is not None:
+            logger.info(f"使用工具 {tool_name} 的本地格式化器")
+        return text
+
+    def _build_format_prompt(self, tool_name: str, result: Any, original_query: str) -> str:
+        """构造结果格式化的prompt"""
+        return f"""
         工具 {tool_name} 执行完成。
         原始问题：{original_query}
         执行结果：{result}
         
         请生成友好的自然语言回复，直接回答用户的问题:
         """
-        return self.generate_response(prompt)
     
 if __name__ == "__main__":
     # 示例用法
@@ -0,0 +1,294 @@
+"""
+JSONL批量调度：逐行读取请求，以有限并发和速率调用代理，结果逐行写入JSONL
+
+用法: python -m agent.batch requests.jsonl -o results.jsonl [--concurrency 8] [--rate 5]
+      [--as-completed] [--no-resume] [--prompt-field body] [--id-field request_id]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import time
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Iterator, Optional, Set, Tuple
+
+if TYPE_CHECKING:
+    from SimpleAgnet import SimpleAgent
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[str, Dict[str, Any]], Awaitable[str]]
+
+
+class RateLimiter:
+    """令牌桶限速，rate为每秒请求数，burst为允许的突发请求数"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        if rate <= 0:
+            raise ValueError(f"速率必须大于0，获取 {rate}")
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class BatchDispatcher:
+    """
+    JSONL批量调度器
+    输入文件按行流式读取，同时在途的请求数不超过concurrency；
+    结果按输入顺序或完成顺序写入输出文件，每行写入后立即flush，
+    中断后重新运行时跳过输出文件中已成功的请求，失败的行从输出文件中移除后重试，每个ID只保留一行
+    """
+
+    def __init__(self, agent: Optional["SimpleAgent"] = None, concurrency: int = 8,
+                 rate: Optional[float] = None, ordered: bool = True,
+                 prompt_field: str = "prompt", id_field: str = "id",
+                 handler: Optional[Handler] = None):
+        """
+        初始化批量调度器
+        Args:
+            agent: 处理请求的代理，未提供handler时必需
+            concurrency: 最大并发请求数
+            rate: 每秒最多发起的请求数，None表示不限速
+            ordered: True时按输入顺序写出结果，False时按完成顺序写出
+            prompt_field: 请求中提示文本的字段名
+            id_field: 请求中唯一ID的字段名，缺失时使用行号
+            handler: 自定义的异步处理函数handler(prompt, record)，默认调用agent.allm_tool_dispatcher
+        """
+        if concurrency < 1:
+            raise ValueError(f"并发数必须大于0，获取 {concurrency}")
+        if agent is None and handler is None:
+            raise ValueError("必须提供agent或handler")
+        self.agent = agent
+        self.concurrency = concurrency
+        self.limiter = RateLimiter(rate, burst=concurrency) if rate else None
+        self.ordered = ordered
+        self.prompt_field = prompt_field
+        self.id_field = id_field
+        self.handler = handler or self._dispatch
+
+    async def _dispatch(self, prompt: str, record: Dict[str, Any]) -> str:
+        return await self.agent.allm_tool_dispatcher(prompt, file_path=record.get("file_path"))
+
+    def run(self, input_path: str, output_path: str, resume: bool = True) -> Dict[str, Any]:
+        """arun的同步入口"""
+        return asyncio.run(self.arun(input_path, output_path, resume))
+
+    async def arun(self, input_path: str, output_path: str, resume: bool = True) -> Dict[str, Any]:
+        """
+        处理整个输入文件
+        Args:
+            input_path: 输入JSONL文件
+            output_path: 输出JSONL文件
+            resume: 是否跳过输出文件中已成功的请求并追加写入（失败的行被移除并重试）；False时覆盖输出文件
+        Returns:
+            吞吐量与延迟统计
+        """
+        completed = self._resume_output(output_path) if resume else set()
+        if completed:
+            logger.info(f"断点续跑，跳过已完成的 {len(completed)} 个请求")
+        self._prepare_output(output_path, resume)
+
+        latencies = []
+        counts = {"succeeded": 0, "failed": 0, "skipped": 0}
+        buffer: Dict[int, Dict[str, Any]] = {}
+        next_seq = 0
+        window = self.concurrency * 4  # 按序输出时最多缓存的已完成结果数
+        start = time.perf_counter()
+
+        with open(output_path, "a", encoding="utf-8") as out:
+            def write(row: Dict[str, Any]) -> None:
+                out.write(json.dumps(row, ensure_ascii=False) + "\n")
+                out.flush()
+
+            def collect(done) -> None:
+                nonlocal next_seq
+                for task in done:
+                    seq, row = task.result()
+                    latencies.append(row["latency_ms"])
+                    counts["failed" if row["error"] else "succeeded"] += 1
+                    if not self.ordered:
+                        write(row)
+                        continue
+                    buffer[seq] = row
+                    while next_seq in buffer:
+                        write(buffer.pop(next_seq))
+                        next_seq += 1
+
+            pending = set()
+            seq = 0
+            for request_id, record in self._iter_records(input_path):
+                if request_id in completed:
+                    counts["skipped"] += 1
+                    continue
+                while len(pending) >= self.concurrency or (self.ordered and seq - next_seq >= window):
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    collect(done)
+                pending.add(asyncio.ensure_future(self._process(seq, request_id, record)))
+                seq += 1
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                collect(done)
+
+        return self._summary(latencies, counts, time.perf_counter() - start)
+
+    async def _process(self, seq: int, request_id: str,
+                       record: Optional[Dict[str, Any]]) -> Tuple[int, Dict[str, Any]]:
+        row = {"id": request_id, "response": None, "error": None}
+        start = time.perf_counter()
+        if record is None:
+            row["error"] = "无效的JSON行"
+        elif not isinstance(record.get(self.prompt_field), str):
+            row["error"] = f"缺少字段 {self.prompt_field}"
+        else:
+            if self.limiter is not None:
+                await self.limiter.acquire()
+                start = time.perf_counter()
+            try:
+                row["response"] = await self.handler(record[self.prompt_field], record)
+            except Exception as e:
+                logger.error(f"请求 {request_id} 处理失败: {str(e)}")
+                row["error"] = str(e)
+        row["latency_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        return seq, row
+
+    def _iter_records(self, input_path: str) -> Iterator[Tuple[str, Optional[Dict[str, Any]]]]:
+        """逐行读取请求，无法解析的行以None表示"""
+        with open(input_path, encoding="utf-8") as f:
+            for lineno, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    yield f"line-{lineno}", None
+                    continue
+                if not isinstance(record, dict):
+                    yield f"line-{lineno}", None
+                    continue
+                request_id = record.get(self.id_field)
+                yield (str(request_id) if request_id is not None else f"line-{lineno}"), record
+
+    @staticmethod
+    def _resume_output(output_path: str) -> Set[str]:
+        """
+        续跑前整理输出文件：保留已成功的行，移除失败的行和中断时写了一半的行，
+        这些请求会重试，重试结果追加写入后每个ID仍只有一行
+        Returns:
+            已成功的请求ID
+        """
+        completed = set()
+        if not os.path.exists(output_path):
+            return completed
+        dropped = 0
+        with open(output_path, encoding="utf-8") as f:
+            for line in f:
+                row = BatchDispatcher._successful_row(line)
+                if row is not None:
+                    completed.add(row["id"])
+                elif line.strip():
+                    dropped += 1
+        if dropped:
+            logger.info(f"移除输出文件中 {dropped} 行失败或不完整的结果，对应请求将重试")
+            tmp_path = f"{output_path}.tmp"
+            with open(output_path, encoding="utf-8") as f, open(tmp_path, "w", encoding="utf-8") as out:
+                for line in f:
+                    if BatchDispatcher._successful_row(line) is not None:
+                        out.write(line if line.endswith("\n") else line + "\n")
+            os.replace(tmp_path, output_path)
+        return completed
+
+    @staticmethod
+    def _successful_row(line: str) -> Optional[Dict[str, Any]]:
+        """解析输出行，不是成功的结果时返回None"""
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError:
+            return None
+        if isinstance(row, dict) and row.get("error") is None and "id" in row:
+            return row
+        return None
+
+    @staticmethod
+    def _prepare_output(output_path: str, resume: bool) -> None:
+        directory = os.path.dirname(output_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if not resume or not os.path.exists(output_path):
+            open(output_path, "w", encoding="utf-8").close()
+            return
+        # 上次中断时最后一行可能不完整，补上换行避免与新结果连在一起
+        with open(output_path, "rb+") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell():
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+
+    @staticmethod
+    def _summary(latencies, counts: Dict[str, int], elapsed: float) -> Dict[str, Any]:
+        processed = counts["succeeded"] + counts["failed"]
+        summary: Dict[str, Any] = dict(counts, processed=processed, elapsed_s=round(elapsed, 3),
+                                       throughput_rps=round(processed / elapsed, 2) if elapsed else 0.0)
+        if latencies:
+            ordered = sorted(latencies)
+            quantiles = statistics.quantiles(ordered, n=100, method="inclusive") if len(ordered) > 1 else ordered * 99
+            summary.update(latency_p50_ms=round(quantiles[49], 2), latency_p90_ms=round(quantiles[89], 2),
+                           latency_p99_ms=round(quantiles[98], 2), latency_max_ms=ordered[-1])
+        return summary
+
+
+def format_summary(summary: Dict[str, Any]) -> str:
+    lines = [
+        f"处理 {summary['processed']} 条（成功 {summary['succeeded']}，失败 {summary['failed']}，"
+        f"跳过 {summary['skipped']}），耗时 {summary['elapsed_s']}s，吞吐 {summary['throughput_rps']} 条/s",
+    ]
+    if "latency_p50_ms" in summary:
+        lines.append(f"延迟 p50 {summary['latency_p50_ms']}ms  p90 {summary['latency_p90_ms']}ms  "
+                     f"p99 {summary['latency_p99_ms']}ms  max {summary['latency_max_ms']}ms")
+    return "\n".join(lines)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="SimpleAgent JSONL批量调度")
+    parser.add_argument("input", help="输入JSONL文件")
+    parser.add_argument("-o", "--output", help="输出JSONL文件，默认为<输入文件名>.out.jsonl")
+    parser.add_argument("--concurrency", type=int, default=8, help="最大并发请求数")
+    parser.add_argument("--rate", type=float, default=None, help="每秒最多发起的请求数")
+    parser.add_argument("--as-completed", action="store_true", help="按完成顺序写出结果")
+    parser.add_argument("--no-resume", action="store_true", help="忽略已有输出，从头开始")
+    parser.add_argument("--prompt-field", default="prompt", help="提示文本字段名")
+    parser.add_argument("--id-field", default="id", help="请求ID字段名")
+    parser.add_argument("--dispatch-mode", default="json", help="代理的工具调度模式")
+    parser.add_argument("--log-level", default="WARNING", help="日志级别")
+    args = parser.parse_args(argv)
+
+    from SimpleAgnet import SimpleAgent
+    logging.getLogger().setLevel(args.log_level)
+
+    output = args.output or os.path.splitext(args.input)[0] + ".out.jsonl"
+    dispatcher = BatchDispatcher(
+        SimpleAgent("batch", dispatch_mode=args.dispatch_mode),
+        concurrency=args.concurrency, rate=args.rate, ordered=not args.as_completed,
+        prompt_field=args.prompt_field, id_field=args.id_field,
+    )
+    summary = dispatcher.run(args.input, output, resume=not args.no_resume)
+    print(format_summary(summary))
+    print(f"结果已写入 {output}")
+
+
+if __name__ == "__main__":
+    main()
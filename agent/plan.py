@@ -0,0 +1,209 @@
+import asyncio
+import logging
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, wait
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Set
+
+logger = logging.getLogger(__name__)
+
+_PLACEHOLDER = re.compile(r"\{\{\s*([\w-]+)\s*\}\}")
+
+
+def substitute(params: Any, results: Dict[str, Any]) -> Any:
+    """
+    把参数中的{{步骤ID}}替换为该步骤的结果
+    参数恰好是一个占位符时保留结果原本的类型，否则按字符串拼接；字典和列表递归替换
+    """
+    if isinstance(params, str):
+        whole = _PLACEHOLDER.fullmatch(params.strip())
+        if whole:
+            return results[whole.group(1)]
+        return _PLACEHOLDER.sub(lambda m: str(results[m.group(1)]), params)
+    if isinstance(params, dict):
+        return {key: substitute(value, results) for key, value in params.items()}
+    if isinstance(params, list):
+        return [substitute(value, results) for value in params]
+    return params
+
+
+def placeholders(params: Any) -> Set[str]:
+    """参数中引用的步骤ID"""
+    if isinstance(params, str):
+        return set(_PLACEHOLDER.findall(params))
+    if isinstance(params, dict):
+        params = list(params.values())
+    if isinstance(params, list):
+        return set().union(*(placeholders(value) for value in params)) if params else set()
+    return set()
+
+
+class ToolPlan:
+    """
+    多工具执行计划
+    每个步骤为{"id", "tool", "params", "depends_on"}，依赖由depends_on和参数中的{{步骤ID}}共同确定。
+    没有依赖关系的步骤并发执行，依赖步骤在前序步骤成功后执行；
+    步骤超时或失败时，依赖它的步骤被取消
+    """
+
+    def __init__(self, steps: Sequence[Dict[str, Any]]):
+        """
+        校验并创建计划
+        Args:
+            steps: 步骤列表，缺少id时按顺序编号为t1、t2...
+        Raises:
+            ValueError: 步骤ID重复、依赖不存在或存在循环依赖时
+        """
+        self.steps: Dict[str, Dict[str, Any]] = {}
+        for i, step in enumerate(steps, 1):
+            step_id = str(step.get("id") or f"t{i}")
+            if step_id in self.steps:
+                raise ValueError(f"计划中的步骤ID重复: {step_id}")
+            if not step.get("tool"):
+                raise ValueError(f"步骤 {step_id} 未指定工具")
+            params = step.get("params")
+            self.steps[step_id] = {
+                "id": step_id,
+                "tool": step["tool"],
+                "params": params,
+                "depends_on": set(step.get("depends_on") or ()) | placeholders(params),
+            }
+        for step in self.steps.values():
+            missing = step["depends_on"] - self.steps.keys()
+            if missing:
+                raise ValueError(f"步骤 {step['id']} 依赖不存在的步骤: {sorted(missing)}")
+        self._check_acyclic()
+
+    def _check_acyclic(self) -> None:
+        remaining = {step_id: set(step["depends_on"]) for step_id, step in self.steps.items()}
+        while remaining:
+            ready = [step_id for step_id, deps in remaining.items() if not deps]
+            if not ready:
+                raise ValueError(f"计划存在循环依赖: {sorted(remaining)}")
+            for step_id in ready:
+                del remaining[step_id]
+            for deps in remaining.values():
+                deps.difference_update(ready)
+
+    @property
+    def tools(self) -> List[str]:
+        return [step["tool"] for step in self.steps.values()]
+
+    def _ready(self, outcomes: Dict[str, Dict[str, Any]], started: Set[str]) -> List[str]:
+        """依赖均已成功的未开始步骤；依赖失败的步骤直接标记为取消"""
+        ready = []
+        changed = True
+        while changed:
+            changed = False
+            for step_id, step in self.steps.items():
+                if step_id in started or step_id in outcomes:
+                    continue
+                failed = [dep for dep in step["depends_on"]
+                          if dep in outcomes and outcomes[dep]["status"] != "ok"]
+                if failed:
+                    outcomes[step_id] = self._outcome(step, "cancelled",
+                                                      error=f"依赖的步骤 {failed} 未成功")
+                    changed = True
+                elif all(dep in outcomes for dep in step["depends_on"]) and step_id not in ready:
+                    ready.append(step_id)
+        return ready
+
+    @staticmethod
+    def _outcome(step: Dict[str, Any], status: str, result: Any = None, error: Optional[str] = None,
+                 params: Any = None, elapsed: float = 0.0) -> Dict[str, Any]:
+        return {"id": step["id"], "tool": step["tool"], "params": params, "status": status,
+                "result": result, "error": error, "elapsed": elapsed}
+
+    def _results(self, outcomes: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        return {step_id: outcome["result"] for step_id, outcome in outcomes.items()
+                if outcome["status"] == "ok"}
+
+    def execute(self, run: Callable[[str, Any], Any], executor: Executor,
+                timeout_for: Callable[[str], Optional[float]]) -> Dict[str, Dict[str, Any]]:
+        """
+        在线程池中执行计划
+        Args:
+            run: 执行单个工具的函数run(tool_name, params)
+            executor: 线程池
+            timeout_for: 返回工具超时秒数的函数，None表示不限时
+        Returns:
+            步骤ID -> {"id", "tool", "params", "status"(ok|error|timeout|cancelled), "result", "error", "elapsed"}，
+            按计划中的步骤顺序排列
+        """
+        outcomes: Dict[str, Dict[str, Any]] = {}
+        running: Dict[Future, tuple] = {}  # future -> (步骤ID, 参数, 开始时间, 截止时间)
+        started: Set[str] = set()
+        while True:
+            for step_id in self._ready(outcomes, started):
+                step = self.steps[step_id]
+                params = substitute(step["params"], self._results(outcomes))
+                timeout = timeout_for(step["tool"])
+                now = time.monotonic()
+                future = executor.submit(run, step["tool"], params)
+                running[future] = (step_id, params, now, now + timeout if timeout else None)
+                started.add(step_id)
+            if not running:
+                break
+
+            deadlines = [deadline for *_, deadline in running.values() if deadline is not None]
+            wait_for = max(min(deadlines) - time.monotonic(), 0) if deadlines else None
+            done, _ = wait(list(running), timeout=wait_for, return_when=FIRST_COMPLETED)
+            now = time.monotonic()
+            for future in list(running):
+                step_id, params, start, deadline = running[future]
+                step = self.steps[step_id]
+                if future in done:
+                    del running[future]
+                    try:
+                        outcomes[step_id] = self._outcome(step, "ok", result=future.result(),
+                                                          params=params, elapsed=now - start)
+                    except Exception as e:
+                        outcomes[step_id] = self._outcome(step, "error", error=str(e),
+                                                          params=params, elapsed=now - start)
+                elif deadline is not None and now >= deadline:
+                    del running[future]
+                    # 未开始的任务会被撤销；已在运行的线程无法强制终止，其结果将被忽略
+                    future.cancel()
+                    logger.warning(f"步骤 {step_id} ({step['tool']}) 超时")
+                    outcomes[step_id] = self._outcome(step, "timeout", error="执行超时",
+                                                      params=params, elapsed=now - start)
+        return {step_id: outcomes[step_id] for step_id in self.steps}
+
+    async def aexecute(self, run: Callable[[str, Any], Awaitable[Any]],
+                       timeout_for: Callable[[str], Optional[float]]) -> Dict[str, Dict[str, Any]]:
+        """execute的异步版本，每个步骤为一个任务，超时由asyncio.wait_for取消"""
+        outcomes: Dict[str, Dict[str, Any]] = {}
+        running: Dict[asyncio.Task, str] = {}
+        started: Set[str] = set()
+
+        async def run_step(step: Dict[str, Any], params: Any) -> Dict[str, Any]:
+            start = time.monotonic()
+            try:
+                result = await asyncio.wait_for(run(step["tool"], params), timeout_for(step["tool"]))
+            except asyncio.TimeoutError:
+                logger.warning(f"步骤 {step['id']} ({step['tool']}) 超时")
+                return self._outcome(step, "timeout", error="执行超时", params=params,
+                                     elapsed=time.monotonic() - start)
+            except Exception as e:
+                return self._outcome(step, "error", error=str(e), params=params,
+                                     elapsed=time.monotonic() - start)
+            return self._outcome(step, "ok", result=result, params=params,
+                                 elapsed=time.monotonic() - start)
+
+        try:
+            while True:
+                for step_id in self._ready(outcomes, started):
+                    step = self.steps[step_id]
+                    params = substitute(step["params"], self._results(outcomes))
+                    running[asyncio.ensure_future(run_step(step, params))] = step_id
+                    started.add(step_id)
+                if not running:
+                    break
+                done, _ = await asyncio.wait(list(running), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    outcomes[running.pop(task)] = task.result()
+        finally:
+            # 调用方被取消时一并取消尚未完成的步骤
+            for task in running:
+                task.cancel()
+        return {step_id: outcomes[step_id] for step_id in self.steps}
@@ -0,0 +1,198 @@
+import logging
+import re
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Pattern, Sequence, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+Matcher = Union[str, Pattern, Callable[[str], Optional[Any]]]
+
+
+class EmbeddingClassifier:
+    """
+    基于示例语句的向量分类器
+    每个路由登记若干示例语句，新输入与各路由示例的最大余弦相似度超过阈值，
+    且领先第二名足够多时才认为分类可信
+    """
+
+    def __init__(self, embed: Callable[[List[str]], Sequence[Sequence[float]]],
+                 threshold: float = 0.85, margin: float = 0.05):
+        """
+        初始化分类器
+        Args:
+            embed: 批量文本向量化函数，例如Embeddings.embed_documents
+            threshold: 命中所需的最小余弦相似度
+            margin: 最优路由需领先第二名的相似度差
+        """
+        self.embed = embed
+        self.threshold = threshold
+        self.margin = margin
+        self._routes: List[str] = []
+        self._matrix = None  # 所有示例的单位向量，与_routes逐行对应
+
+    @staticmethod
+    def _normalize(vectors):
+        import numpy as np
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def add_examples(self, route: str, utterances: Sequence[str]) -> None:
+        import numpy as np
+        vectors = self._normalize(self.embed(list(utterances)))
+        self._matrix = vectors if self._matrix is None else np.vstack([self._matrix, vectors])
+        self._routes.extend([route] * len(utterances))
+
+    def remove_route(self, route: str) -> None:
+        keep = [i for i, name in enumerate(self._routes) if name != route]
+        self._routes = [self._routes[i] for i in keep]
+        self._matrix = self._matrix[keep] if keep else None
+
+    def classify(self, prompt: str) -> Optional[Tuple[str, float]]:
+        """返回(路由名, 相似度)，不可信时返回None"""
+        if self._matrix is None:
+            return None
+        scores = self._matrix @ self._normalize(self.embed([prompt]))[0]
+        best: Dict[str, float] = {}
+        for route, score in zip(self._routes, scores):
+            best[route] = max(best.get(route, -1.0), float(score))
+        ranked = sorted(best.items(), key=lambda item: item[1], reverse=True)
+        route, score = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else -1.0
+        if score >= self.threshold and score - runner_up >= self.margin:
+            return route, score
+        return None
+
+
+class Router:
+    """
+    无需LLM的快速路由
+    在意图分析之前按注册顺序尝试各路由的规则，规则完整匹配用户输入时直接选定工具和参数；
+    规则都不匹配时再尝试可选的向量分类器，仍不可信则返回None，由LLM分析意图。
+    分类器只能确定路由，不能给出工具参数：分类为工具路由时必须登记了该路由的参数提取函数，
+    否则同样交给LLM
+    """
+
+    DIRECT_RESPONSE = "direct_response"
+
+    def __init__(self, classifier: Optional[EmbeddingClassifier] = None):
+        """
+        初始化路由器
+        Args:
+            classifier: 可选的向量分类器
+        """
+        self.classifier = classifier
+        self._rules: List[Tuple[str, Callable[[str], Optional[Any]]]] = []
+        self._extractors: Dict[str, Callable[[str], Optional[Any]]] = {}  # 分类器命中工具路由时提取参数
+        self._lock = threading.Lock()
+        self._hits: Dict[str, int] = defaultdict(int)
+        self.total = 0
+        self.fallbacks = 0
+
+    def add_rule(self, route: str, matcher: Matcher) -> None:
+        """
+        为路由添加规则
+        Args:
+            route: 路由名，即工具名或direct_response
+            matcher: 正则表达式或函数。正则需完整匹配去除首尾空白后的输入，
+                有命名分组时以分组字典作为工具参数，否则以匹配文本作为参数；
+                函数返回工具参数，不匹配时返回None
+        """
+        if isinstance(matcher, (str, re.Pattern)):
+            matcher = self._regex_matcher(re.compile(matcher))
+        with self._lock:
+            self._rules.append((route, matcher))
+
+    @staticmethod
+    def _regex_matcher(pattern: Pattern) -> Callable[[str], Optional[Any]]:
+        def match(prompt: str) -> Optional[Any]:
+            m = pattern.fullmatch(prompt)
+            if m is None:
+                return None
+            groups = {k: v for k, v in m.groupdict().items() if v is not None}
+            return groups or m.group(0)
+        return match
+
+    def set_extractor(self, route: str, extractor: Callable[[str], Optional[Any]]) -> None:
+        """
+        登记工具路由的参数提取函数，分类器命中该路由时用它从输入中提取工具参数
+        Args:
+            route: 工具路由名
+            extractor: 接收去除首尾空白的输入，返回工具参数，无法提取时返回None
+        """
+        with self._lock:
+            self._extractors[route] = extractor
+
+    def remove_route(self, route: str) -> None:
+        with self._lock:
+            self._rules = [(name, matcher) for name, matcher in self._rules if name != route]
+            self._extractors.pop(route, None)
+        if self.classifier is not None:
+            self.classifier.remove_route(route)
+
+    def route(self, prompt: str) -> Optional[Dict[str, Any]]:
+        """
+        尝试快速路由
+        Args:
+            prompt: 用户输入
+        Returns:
+            与意图分析结果相同结构的字典（额外包含route），不可信时返回None
+        """
+        text = prompt.strip()
+        decision = None
+        for route, matcher in list(self._rules):
+            try:
+                params = matcher(text)
+            except Exception as e:
+                logger.warning(f"路由 {route} 的规则执行失败: {str(e)}")
+                continue
+            if params is not None:
+                decision = self._decision(route, params)
+                break
+        if decision is None and self.classifier is not None:
+            result = self.classifier.classify(text)
+            if result is not None:
+                decision = self._classified(result[0], text)
+        with self._lock:
+            self.total += 1
+            if decision is None:
+                self.fallbacks += 1
+            else:
+                self._hits[decision["route"]] += 1
+        return decision
+
+    def _classified(self, route: str, text: str) -> Optional[Dict[str, Any]]:
+        """分类器命中后的路由决定，工具路由无法提取参数时返回None"""
+        if route == self.DIRECT_RESPONSE:
+            return self._decision(route, None)
+        extractor = self._extractors.get(route)
+        if extractor is None:
+            return None
+        try:
+            params = extractor(text)
+        except Exception as e:
+            logger.warning(f"路由 {route} 的参数提取失败: {str(e)}")
+            return None
+        return None if params is None else self._decision(route, params)
+
+    def _decision(self, route: str, params: Any) -> Dict[str, Any]:
+        if route == self.DIRECT_RESPONSE:
+            return {"route": route, "tool": None, "action": "direct_response", "params": None}
+        return {"route": route, "tool": route, "action": "use", "params": params}
+
+    def stats(self) -> Dict[str, Any]:
+        """各路由的命中次数和命中率，fallback为交给LLM分析的次数"""
+        with self._lock:
+            total = self.total
+            routes = {
+                route: {"hits": hits, "hit_rate": hits / total if total else 0.0}
+                for route, hits in self._hits.items()
+            }
+            return {
+                "total": total,
+                "routes": routes,
+                "fallback": {"hits": self.fallbacks,
+                             "hit_rate": self.fallbacks / total if total else 0.0},
+            }
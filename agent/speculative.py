@@ -0,0 +1,162 @@
+import asyncio
+import re
+import threading
+import time
+from concurrent.futures import Executor
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+_CJK = re.compile(r"[\u4e00-\u9fff]")
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数：每个汉字约1个token，其余字符约4个一个token"""
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+class SpeculativeStats:
+    """
+    推测执行的统计
+    used为意图分析判定直接回答、推测结果被采用的次数，此时节省的延迟为推测生成与意图分析重叠的时间；
+    discarded为判定需要工具、推测结果被丢弃的次数，此时浪费的token为提示和已生成内容的估算值
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.used = 0
+        self.discarded = 0
+        self.wasted_tokens = 0
+        self.latency_saved = 0.0
+
+    def record_used(self, saved_seconds: float) -> None:
+        with self._lock:
+            self.used += 1
+            self.latency_saved += max(saved_seconds, 0.0)
+
+    def record_discarded(self, wasted_tokens: int) -> None:
+        with self._lock:
+            self.discarded += 1
+            self.wasted_tokens += wasted_tokens
+
+    def summary(self) -> Dict[str, float]:
+        with self._lock:
+            runs = self.used + self.discarded
+            return {
+                "runs": runs,
+                "used": self.used,
+                "discarded": self.discarded,
+                "use_rate": self.used / runs if runs else 0.0,
+                "wasted_tokens": self.wasted_tokens,
+                "wasted_tokens_per_run": self.wasted_tokens / runs if runs else 0.0,
+                "latency_saved_s": round(self.latency_saved, 4),
+                "latency_saved_per_run_ms": round(self.latency_saved * 1000 / runs, 2) if runs else 0.0,
+            }
+
+
+class SpeculativeResponse:
+    """在线程池中流式生成直接回答，可在片段之间取消并关闭连接"""
+
+    def __init__(self, prompt: str, stream: Callable[[], Iterator[str]],
+                 executor: Executor, stats: SpeculativeStats):
+        """
+        启动推测生成
+        Args:
+            prompt: 生成所用的提示
+            stream: 返回文本片段迭代器的函数
+            executor: 执行生成的线程池
+            stats: 统计对象
+        """
+        self.prompt = prompt
+        self.stats = stats
+        self.parts: List[str] = []
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+        self._recorded = False  # 浪费的token只统计一次
+        self._future = executor.submit(self._run, stream)
+
+    def _run(self, stream: Callable[[], Iterator[str]]) -> str:
+        tokens = stream()
+        try:
+            for token in tokens:
+                if self._cancel.is_set():
+                    break
+                self.parts.append(token)
+        finally:
+            # 关闭生成器会关闭底层HTTP响应，服务端随之停止生成
+            tokens.close()
+            with self._lock:
+                self.finished = time.perf_counter()
+                if self._cancel.is_set():
+                    self._discard()
+        return "".join(self.parts)
+
+    def _discard(self) -> None:
+        if not self._recorded:
+            self._recorded = True
+            self.stats.record_discarded(estimate_tokens(self.prompt) + len(self.parts))
+
+    def result(self, decided_at: float) -> str:
+        """
+        等待并采用推测结果
+        Args:
+            decided_at: 意图分析完成的时间（perf_counter）
+        """
+        text = self._future.result()
+        waited = time.perf_counter() - decided_at
+        self.stats.record_used((self.finished - self.started) - waited)
+        return text
+
+    def add_done_callback(self, fn: Callable[[], None]) -> None:
+        """生成结束、失败或被撤销时调用fn"""
+        self._future.add_done_callback(lambda _future: fn())
+
+    def cancel(self) -> None:
+        """丢弃推测结果，尚未开始执行时直接撤销"""
+        with self._lock:
+            self._cancel.set()
+            if self._future.cancel() or self.finished is not None:
+                self._discard()
+
+
+class AsyncSpeculativeResponse:
+    """SpeculativeResponse的异步版本，取消时直接取消生成任务"""
+
+    def __init__(self, prompt: str, stream: Callable[[], AsyncIterator[str]],
+                 stats: SpeculativeStats):
+        self.prompt = prompt
+        self.stats = stats
+        self.parts: List[str] = []
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+        self._running = False
+        self._task = asyncio.create_task(self._run(stream))
+
+    async def _run(self, stream: Callable[[], AsyncIterator[str]]) -> str:
+        self._running = True
+        try:
+            async for token in stream():
+                self.parts.append(token)
+        except asyncio.CancelledError:
+            self.stats.record_discarded(estimate_tokens(self.prompt) + len(self.parts))
+            raise
+        finally:
+            self.finished = time.perf_counter()
+        return "".join(self.parts)
+
+    async def result(self, decided_at: float) -> str:
+        text = await self._task
+        waited = time.perf_counter() - decided_at
+        self.stats.record_used((self.finished - self.started) - waited)
+        return text
+
+    def cancel(self) -> None:
+        if not self._task.done():
+            if not self._running:
+                # 任务尚未开始执行，只浪费了排队时间
+                self.stats.record_discarded(0)
+            self._task.cancel()
+        else:
+            # 已经生成完毕，整段回复都被浪费
+            self.stats.record_discarded(estimate_tokens(self.prompt) + len(self.parts))
@@ -0,0 +1,101 @@
+"""
+请求合并验证：N个线程同时以相同提示调用LanguageModel.generate_text，
+上游（本地桩客户端，不访问网络）应只收到一次请求，且所有调用拿到相同结果
+
+用法: python benchmarks/coalescing.py [--threads 32] [--latency 0.2]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from llm.base_model import LanguageModel
+
+
+class StubCompletions:
+    """模拟有固定延迟的chat.completions接口，并统计调用次数"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _reply(self, messages) -> SimpleNamespace:
+        with self._lock:
+            self.calls += 1
+        content = f"answer to: {messages[-1]['content']}"
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    def create(self, model, messages, stream=False, **kwargs):
+        time.sleep(self.latency)
+        return self._reply(messages)
+
+
+class AsyncStubCompletions(StubCompletions):
+    async def create(self, model, messages, stream=False, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self._reply(messages)
+
+
+def stub_model(latency: float) -> LanguageModel:
+    model = LanguageModel()
+    model._client = SimpleNamespace(chat=SimpleNamespace(completions=StubCompletions(latency)))
+    model._aclient = SimpleNamespace(chat=SimpleNamespace(completions=AsyncStubCompletions(latency)))
+    return model
+
+
+def run_threads(threads: int, latency: float) -> None:
+    model = stub_model(latency)
+    barrier = threading.Barrier(threads)
+
+    def call(_):
+        barrier.wait()
+        return model.generate_text("今天天气怎么样")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(call, range(threads)))
+    elapsed = time.perf_counter() - start
+
+    upstream = model.client.chat.completions.calls
+    assert upstream == 1, f"期望上游调用1次，实际 {upstream} 次"
+    assert len(set(results)) == 1
+    print(f"threads: {threads} 个并发调用 -> 上游 {upstream} 次, 耗时 {elapsed * 1000:.1f} ms, "
+          f"{model.flight.stats()}")
+
+
+def run_async(tasks: int, latency: float) -> None:
+    model = stub_model(latency)
+
+    async def main():
+        return await asyncio.gather(*(model.agenerate_text("今天天气怎么样") for _ in range(tasks)))
+
+    start = time.perf_counter()
+    results = asyncio.run(main())
+    elapsed = time.perf_counter() - start
+
+    upstream = model.aclient.chat.completions.calls
+    assert upstream == 1, f"期望上游调用1次，实际 {upstream} 次"
+    assert len(set(results)) == 1
+    print(f"asyncio: {tasks} 个并发调用 -> 上游 {upstream} 次, 耗时 {elapsed * 1000:.1f} ms, "
+          f"{model.flight.stats()}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="相同请求合并验证")
+    parser.add_argument("--threads", type=int, default=32, help="并发调用数")
+    parser.add_argument("--latency", type=float, default=0.2, help="模拟的上游延迟（秒）")
+    args = parser.parse_args()
+    run_threads(args.threads, args.latency)
+    run_async(args.threads, args.latency)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+工具进程隔离基准：一个会话执行失控的大数连乘时，测量其他会话的小计算请求的延迟，
+对比在调用线程内执行（失控计算持有GIL）与在ToolProcessPool子进程中执行（超时后终止子进程）
+
+用法: python benchmarks/process_pool.py [--factors 400] [--calls 20] [--timeout 1]
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+
+def measure(agent, label: str, factors: int, calls: int, timeout: float, interval: float = 0.1) -> None:
+    from SimpleAgnet import ToolExecutionError
+
+    # 乘方有结果大小检查，会直接拒绝；连乘每一步都合法，但总耗时随因子数平方增长
+    runaway = {"numbers": [3 ** 2500] * factors, "operation": "*"}
+    outcome = {}
+
+    def run_away():
+        start = time.perf_counter()
+        try:
+            agent.tool_use("calculator", runaway, timeout=timeout)
+            outcome["status"] = "完成"
+        except ToolExecutionError as e:
+            outcome["status"] = type(e).__name__
+        outcome["elapsed"] = time.perf_counter() - start
+
+    thread = threading.Thread(target=run_away)
+    begin = time.perf_counter() + 0.05  # 让失控计算先开始
+    thread.start()
+    latencies = []
+    for i in range(calls):
+        # 按计划时间发出请求，从计划时间起算延迟：线程被GIL阻塞而未能按时发出也计入延迟
+        scheduled = begin + i * interval
+        time.sleep(max(scheduled - time.perf_counter(), 0))
+        assert agent.tool_use("calculator", f"{i}+1") == i + 1
+        latencies.append((time.perf_counter() - scheduled) * 1000)
+    thread.join()
+    print(f"{label:<8} 其他请求 p50 {statistics.median(latencies):8.2f} ms  max {max(latencies):8.2f} ms | "
+          f"失控请求: {outcome['status']}，{outcome['elapsed']:.2f}s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="工具进程隔离基准")
+    parser.add_argument("--factors", type=int, default=400, help="失控计算中连乘的 3^2500 个数")
+    parser.add_argument("--calls", type=int, default=20, help="失控计算期间的其他请求数（每0.1秒一个）")
+    parser.add_argument("--timeout", type=float, default=1.0, help="工具超时（秒）")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    from SimpleAgnet import SimpleAgent
+    from tool.process_pool import ToolProcessPool
+
+    measure(SimpleAgent("inline"), "线程内", args.factors, args.calls, args.timeout)
+
+    with ToolProcessPool(workers=2) as pool:
+        agent = SimpleAgent("isolated", process_pool=pool)
+        measure(agent, "进程池", args.factors, args.calls, args.timeout)
+
+        rounds = 1000
+        start = time.perf_counter()
+        for i in range(rounds):
+            pool.run(agent.get_tool("calculator"), f"{i}*2")
+        per_call_ms = (time.perf_counter() - start) * 1000 / rounds
+        print(f"进程池单次调用开销 {per_call_ms:.3f} ms（{rounds}次平均）")
+        time.sleep(0.5)  # 等待后台补充的进程就绪
+        print(f"进程池统计: {pool.stats()}")
+
+
+if __name__ == "__main__":
+    main()
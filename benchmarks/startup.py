@@ -0,0 +1,62 @@
+"""
+冷启动基准：在全新的子进程中测量导入并创建SimpleAgent、首次执行工具的耗时
+
+用法: python benchmarks/startup.py [--runs 5] [--with-rag]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, logging, time
+start = time.perf_counter()
+from SimpleAgnet import SimpleAgent
+imported = time.perf_counter()
+agent = SimpleAgent("bench")
+created = time.perf_counter()
+agent.tool_use("calculator", "3+5")
+tool_done = time.perf_counter()
+timings = {
+    "import": imported - start,
+    "init": created - imported,
+    "first_tool": tool_done - created,
+    "total": tool_done - start,
+}
+if WITH_RAG:
+    agent.rag_agent.embeddings
+    timings["rag_init"] = time.perf_counter() - tool_done
+print("__RESULT__" + json.dumps(timings))
+"""
+
+
+def run_once(with_rag: bool) -> dict:
+    env = dict(os.environ)
+    env.setdefault("API-KEY", "benchmark")
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE.replace("WITH_RAG", str(with_rag))],
+        cwd=PROJECT_ROOT, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    line = next(line for line in output.splitlines() if line.startswith("__RESULT__"))
+    return json.loads(line[len("__RESULT__"):])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="SimpleAgent冷启动基准")
+    parser.add_argument("--runs", type=int, default=5, help="重复次数")
+    parser.add_argument("--with-rag", action="store_true", help="同时测量首次使用RAG的开销")
+    args = parser.parse_args()
+
+    runs = [run_once(args.with_rag) for _ in range(args.runs)]
+    for key in runs[0]:
+        values = [run[key] for run in runs]
+        print(f"{key:>10}: median {statistics.median(values) * 1000:8.1f} ms  "
+              f"max {max(values) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+天气工具连接复用与批量查询基准：在本地启动一个模拟天气接口的HTTP服务（不访问网络），
+对比每次新建连接、连接池顺序查询、连接池批量查询和异步批量查询的耗时与建立的TCP连接数
+
+用法: python benchmarks/weather_pool.py [--cities 32] [--latency 0.05]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from tool.Weather import Weather
+
+
+class StubWeatherServer(ThreadingHTTPServer):
+    """模拟天气接口，固定延迟后返回城市名，并统计请求数和连接数"""
+    daemon_threads = True
+    request_queue_size = 128  # 默认的5在并发建连时会溢出，导致客户端等待SYN重传
+
+    def __init__(self, latency: float):
+        super().__init__(("127.0.0.1", 0), StubWeatherHandler)
+        self.latency = latency
+        self.requests = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/tq.php"
+
+    def reset(self) -> None:
+        with self._lock:
+            self.requests = self.connections = 0
+
+
+class StubWeatherHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # 支持keep-alive
+    disable_nagle_algorithm = True  # 头部和正文分两次写出，避免keep-alive连接上的延迟确认
+
+    def setup(self):
+        super().setup()
+        with self.server._lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        with self.server._lock:
+            self.server.requests += 1
+        city = parse_qs(urlparse(self.path).query).get("dz", [""])[0]
+        time.sleep(self.server.latency)
+        body = f"{city}\\r晴 25℃".encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def measure(server: StubWeatherServer, label: str, fn, cities) -> None:
+    server.reset()
+    start = time.perf_counter()
+    results = fn()
+    elapsed = time.perf_counter() - start
+    for city in cities:
+        assert results[city] == f"{city}\n晴 25℃", f"{label}: {city} 的结果不正确: {results[city]!r}"
+    print(f"{label:<28} {len(cities)} 个城市, 耗时 {elapsed * 1000:8.1f} ms, "
+          f"请求 {server.requests} 次, 新建连接 {server.connections} 个")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="天气工具连接池与批量查询基准")
+    parser.add_argument("--cities", type=int, default=32, help="查询的城市数")
+    parser.add_argument("--latency", type=float, default=0.05, help="模拟的接口延迟（秒）")
+    parser.add_argument("--pool-size", type=int, default=16, help="连接池大小")
+    args = parser.parse_args()
+
+    server = StubWeatherServer(args.latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    cities = [f"城市{i}" for i in range(args.cities)]
+    weather = Weather(base_url=server.url, pool_size=args.pool_size)
+
+    def unpooled():
+        # 改造前的写法：每次请求都新建连接
+        return {city: Weather._text(requests.get(server.url, params={"dz": city}).text) for city in cities}
+
+    try:
+        measure(server, "每次新建连接", unpooled, cities)
+        measure(server, "连接池顺序查询 fetch", lambda: {city: weather.fetch(city) for city in cities}, cities)
+        measure(server, "连接池批量查询 fetch_many", lambda: weather.fetch_many(cities), cities)
+
+        async def afetch_many():
+            try:
+                return await weather.afetch_many(cities)
+            finally:
+                await weather.aclose()
+
+        measure(server, "异步批量查询 afetch_many", lambda: asyncio.run(afetch_many()), cities)
+    finally:
+        weather.close()
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -24,6 +24,18 @@ class BaseCallback(ABC):
         """Called when LLM processing fails"""
         pass
 
+    def on_llm_new_token(self, token: str, **kwargs) -> None:
+        """Called for each streamed token (optional hook)"""
+        pass
+
+    def on_cache_hit(self, cache_name: str, key: str, **kwargs) -> None:
+        """Called when a cache lookup hits (optional hook)"""
+        pass
+
+    def on_cache_miss(self, cache_name: str, key: str, **kwargs) -> None:
+        """Called when a cache lookup misses (optional hook)"""
+        pass
+
     @abstractmethod
     def on_rag_start(self, file_path: str, query: str, **kwargs) -> None:
         """Called when RAG processing starts"""
@@ -39,6 +51,10 @@ class BaseCallback(ABC):
         """Called when RAG processing fails"""
         pass
 
+    def on_rag_progress(self, file_path: str, pages: int, chunks: int, **kwargs) -> None:
+        """Called as document ingestion makes progress (optional hook)"""
+        pass
+
     @abstractmethod
     def on_tool_start(self, tool_name: str, params: Dict[str, Any], **kwargs) -> None:
         """Called when tool execution starts"""
@@ -105,6 +121,15 @@ class CallbackHandler:
     def on_llm_error(self, error: Exception, **kwargs) -> None:
         self._safe_execute('on_llm_error', error, **kwargs)
 
+    def on_llm_new_token(self, token: str, **kwargs) -> None:
+        self._safe_execute('on_llm_new_token', token, **kwargs)
+
+    def on_cache_hit(self, cache_name: str, key: str, **kwargs) -> None:
+        self._safe_execute('on_cache_hit', cache_name, key, **kwargs)
+
+    def on_cache_miss(self, cache_name: str, key: str, **kwargs) -> None:
+        self._safe_execute('on_cache_miss', cache_name, key, **kwargs)
+
     def on_rag_start(self, file_path: str, query: str, **kwargs) -> None:
         self._safe_execute('on_rag_start', file_path, query, **kwargs)
 
@@ -114,6 +139,9 @@ class CallbackHandler:
     def on_rag_error(self, error: Exception, **kwargs) -> None:
         self._safe_execute('on_rag_error', error, **kwargs)
 
+    def on_rag_progress(self, file_path: str, pages: int, chunks: int, **kwargs) -> None:
+        self._safe_execute('on_rag_progress', file_path, pages, chunks, **kwargs)
+
     def on_tool_start(self, tool_name: str, params: Dict[str, Any], **kwargs) -> None:
         self._safe_execute('on_tool_start', tool_name, params, **kwargs)
 
@@ -136,6 +164,15 @@ class LoggingCallback(BaseCallback):
     def on_llm_error(self, error: Exception, **kwargs) -> None:
         logger.error(f"LLM error: {str(error)}")
 
+    def on_llm_new_token(self, token: str, **kwargs) -> None:
+        logger.debug(f"LLM token: {token!r}")
+
+    def on_cache_hit(self, cache_name: str, key: str, **kwargs) -> None:
+        logger.info(f"Cache {cache_name} hit - key: {key[:16]}, stats: {kwargs.get('stats')}")
+
+    def on_cache_miss(self, cache_name: str, key: str, **kwargs) -> None:
+        logger.info(f"Cache {cache_name} miss - key: {key[:16]}, stats: {kwargs.get('stats')}")
+
     def on_rag_start(self, file_path: str, query: str, **kwargs) -> None:
         logger.info(f"RAG started - File: {file_path}, Query: {query}")
 
@@ -145,11 +182,16 @@ class LoggingCallback(BaseCallback):
     def on_rag_error(self, error: Exception, **kwargs) -> None:
         logger.error(f"RAG error: {str(error)}")
 
+    def on_rag_progress(self, file_path: str, pages: int, chunks: int, **kwargs) -> None:
+        logger.info(f"RAG ingesting {file_path} - pages: {pages}, chunks: {chunks}")
+
     def on_tool_start(self, tool_name: str, params: Dict[str, Any], **kwargs) -> None:
-        logger.info(f"Tool {tool_name} started with params: {params}")
+        cached = " (cached)" if kwargs.get("cached") else ""
+        logger.info(f"Tool {tool_name} started{cached} with params: {params}")
 
     def on_tool_end(self, tool_name: str, result: Any, **kwargs) -> None:
-        logger.info(f"Tool {tool_name} completed - Result: {result}")
+        cached = " (cached)" if kwargs.get("cached") else ""
+        logger.info(f"Tool {tool_name} completed{cached} - Result: {result}")
 
     def on_tool_error(self, tool_name: str, error: Exception, **kwargs) -> None:
         logger.error(f"Tool {tool_name} error: {str(error)}")
@@ -1,42 +1,310 @@
 from dotenv  import load_dotenv
-from openai import OpenAI
+import json
 import os
+import threading
 load_dotenv()
-from langchain_core.language_models import BaseLLM
-from langchain_core.outputs import LLMResult
-from typing import Optional, List, Dict, Any, Iterator
-import os
-from openai import OpenAI
-from langchain_openai import ChatOpenAI
+from typing import TYPE_CHECKING, Optional, List, Dict, Any, AsyncIterator, Iterator
+import sys
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+from callback.callback import CallbackHandler
+from llm.response_cache import ResponseCache
+from llm.singleflight import SingleFlight
+
+if TYPE_CHECKING:
+    # 以下依赖导入较慢，仅用于类型标注，运行时在首次使用时再导入
+    from langchain_core.outputs import LLMResult
+    from langchain_openai import ChatOpenAI
+    from openai import AsyncOpenAI, OpenAI
+
+
 class LanguageModel:
-    def __init__(self,model_name="deepseek-chat"):
+    def __init__(self,model_name="deepseek-chat",
+                 cache: Optional[ResponseCache] = None,
+                 callback: Optional[CallbackHandler] = None):
+        """
+        Args:
+            model_name: 模型名称
+            cache: 回复缓存，默认使用仅内存的ResponseCache
+            callback: 回调处理器，用于上报缓存命中情况
+        """
         super().__init__()
         self.model_name=model_name
         self.api_key=os.getenv("API-KEY")
-        self.client = OpenAI(api_key=self.api_key, base_url="https://api.deepseek.com")
-        self.llm =ChatOpenAI(model="deepseek-chat",api_key=self.api_key,base_url="https://api.deepseek.com")
+        self.base_url="https://api.deepseek.com"
+        self.system_prompt="You are a helpful assistant"
+        self.cache = cache if cache is not None else ResponseCache()
+        self.callback = callback or CallbackHandler(name="LLMCallback")
+        # 合并并发的相同请求，只向上游发起一次
+        self.flight = SingleFlight()
+        # 客户端在首次使用时创建
+        self._client: Optional["OpenAI"] = None
+        self._aclient: Optional["AsyncOpenAI"] = None
+        self._llm: Optional["ChatOpenAI"] = None
+        self._init_lock = threading.Lock()
+
+    @property
+    def client(self) -> "OpenAI":
+        if self._client is None:
+            with self._init_lock:
+                if self._client is None:
+                    from openai import OpenAI
+                    self._client = OpenAI(api_key=self.api_key, base_url=self.base_url)
+        return self._client
+
+    @property
+    def aclient(self) -> "AsyncOpenAI":
+        """异步客户端，可在同一事件循环上并发处理大量请求"""
+        if self._aclient is None:
+            with self._init_lock:
+                if self._aclient is None:
+                    from openai import AsyncOpenAI
+                    self._aclient = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url)
+        return self._aclient
+
+    @property
+    def llm(self) -> "ChatOpenAI":
+        if self._llm is None:
+            with self._init_lock:
+                if self._llm is None:
+                    from langchain_openai import ChatOpenAI
+                    self._llm = ChatOpenAI(model="deepseek-chat", api_key=self.api_key,
+                                           base_url=self.base_url)
+        return self._llm
 
     def generate_text(
         self, 
         prompt: List[str], 
         stop: Optional[List[str]] = None,
+        use_cache: bool = True,
         **kwargs: Any
-    ) -> LLMResult:
-        
+    ) -> "LLMResult":
+        """
+        生成回复
+        Args:
+            prompt: 用户提示
+            stop: 停止词
+            use_cache: 是否使用回复缓存，False时本次调用绕过缓存，也不与其他请求合并
+            **kwargs: 采样参数（temperature、top_p、max_tokens等）
+        """
+        key = self._cache_key(prompt, stop, kwargs)
+        cached = self._cache_lookup(key, use_cache)
+        if cached is not None:
+            return cached
+
+        def request() -> str:
+            response = self.client.chat.completions.create(
+                model='deepseek-chat',
+                messages=self._messages(prompt),
+                stream=False,
+                **self._request_params(stop, kwargs)
+            )
+            text = response.choices[0].message.content
+            if use_cache:
+                self.cache.put(key, text)
+            return text
+
+        if not use_cache:
+            return request()
+        return self.flight.do(key, request)
+
+    async def agenerate_text(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        use_cache: bool = True,
+        **kwargs: Any
+    ) -> str:
+        """generate_text的异步版本"""
+        key = self._cache_key(prompt, stop, kwargs)
+        cached = self._cache_lookup(key, use_cache)
+        if cached is not None:
+            return cached
+
+        async def request() -> str:
+            response = await self.aclient.chat.completions.create(
+                model='deepseek-chat',
+                messages=self._messages(prompt),
+                stream=False,
+                **self._request_params(stop, kwargs)
+            )
+            text = response.choices[0].message.content
+            if use_cache:
+                self.cache.put(key, text)
+            return text
+
+        if not use_cache:
+            return await request()
+        return await self.flight.ado(key, request)
+
+    def generate_with_tools(
+        self,
+        prompt: str,
+        tools: List[Dict[str, Any]],
+        tool_choice: str = "auto",
+        use_cache: bool = True,
+        **kwargs: Any
+    ) -> Dict[str, Any]:
+        """
+        以function calling方式生成，模型在一次请求中决定是否调用工具并给出参数
+        Args:
+            prompt: 用户提示
+            tools: chat API格式的工具定义列表
+            tool_choice: auto（模型决定）| none | required
+            use_cache: 是否使用回复缓存
+        Returns:
+            {"content": 文本回复或None, "tool_calls": [{"id", "name", "arguments"}]}，
+            arguments为模型生成的JSON字符串
+        """
+        params = dict(kwargs, tools=tools, tool_choice=tool_choice)
+        key = self._cache_key(prompt, None, params)
+        cached = self._cache_lookup(key, use_cache)
+        if cached is not None:
+            return json.loads(cached)
+
+        def request() -> Dict[str, Any]:
+            response = self.client.chat.completions.create(
+                model='deepseek-chat',
+                messages=self._messages(prompt),
+                stream=False,
+                **params
+            )
+            result = self._tool_message(response.choices[0].message)
+            if use_cache:
+                self.cache.put(key, json.dumps(result, ensure_ascii=False))
+            return result
+
+        if not use_cache:
+            return request()
+        return self.flight.do(key, request)
+
+    async def agenerate_with_tools(
+        self,
+        prompt: str,
+        tools: List[Dict[str, Any]],
+        tool_choice: str = "auto",
+        use_cache: bool = True,
+        **kwargs: Any
+    ) -> Dict[str, Any]:
+        """generate_with_tools的异步版本"""
+        params = dict(kwargs, tools=tools, tool_choice=tool_choice)
+        key = self._cache_key(prompt, None, params)
+        cached = self._cache_lookup(key, use_cache)
+        if cached is not None:
+            return json.loads(cached)
+
+        async def request() -> Dict[str, Any]:
+            response = await self.aclient.chat.completions.create(
+                model='deepseek-chat',
+                messages=self._messages(prompt),
+                stream=False,
+                **params
+            )
+            result = self._tool_message(response.choices[0].message)
+            if use_cache:
+                self.cache.put(key, json.dumps(result, ensure_ascii=False))
+            return result
+
+        if not use_cache:
+            return await request()
+        return await self.flight.ado(key, request)
+
+    @staticmethod
+    def _tool_message(message: Any) -> Dict[str, Any]:
+        """把API返回的message转为可缓存的字典"""
+        return {
+            "content": message.content,
+            "tool_calls": [
+                {"id": call.id, "name": call.function.name, "arguments": call.function.arguments}
+                for call in (message.tool_calls or [])
+            ],
+        }
+
+    def _messages(self, prompt: str) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": prompt},
+        ]
+
+    @staticmethod
+    def _request_params(stop: Optional[List[str]], kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        params = dict(kwargs)
+        if stop:
+            params["stop"] = stop
+        return params
+
+    def _cache_key(self, prompt: str, stop: Optional[List[str]], kwargs: Dict[str, Any]) -> str:
+        return ResponseCache.make_key('deepseek-chat', self.system_prompt, prompt,
+                                      self._request_params(stop, kwargs))
+
+    def _cache_lookup(self, key: str, use_cache: bool) -> Optional[str]:
+        """查询回复缓存并通过回调上报命中情况"""
+        if not use_cache:
+            return None
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.callback.on_cache_hit("llm_response", key, stats=self.cache.stats())
+        else:
+            self.callback.on_cache_miss("llm_response", key, stats=self.cache.stats())
+        return cached
+
+    def stream_text(self, prompt: str, use_cache: bool = True, **kwargs: Any) -> Iterator[str]:
+        """流式生成，逐个产出文本片段；命中缓存时一次性产出完整回复"""
+        return self._stream(prompt, use_cache=use_cache, **kwargs)
+
+    def _stream(self, prompt: str, use_cache: bool = True, **kwargs: Any) -> Iterator[str]:
+        stop = kwargs.pop("stop", None)
+        key = self._cache_key(prompt, stop, kwargs)
+        cached = self._cache_lookup(key, use_cache)
+        if cached is not None:
+            yield cached
+            return
         response = self.client.chat.completions.create(
             model='deepseek-chat',
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant"},
-                {"role": "user", "content": prompt},
-            ],
-            stream=False
+            messages=self._messages(prompt),
+            stream=True,
+            **self._request_params(stop, kwargs)
         )
-        
-        return response.choices[0].message.content
-    
-    def _stream(self, prompt: str, **kwargs: Any) -> Iterator[LLMResult]:
-        raise NotImplementedError("Streaming not implemented")
-    
+        parts = []
+        try:
+            for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    yield parts[-1]
+        finally:
+            # 调用方提前停止迭代时关闭连接
+            response.close()
+        # 只缓存完整生成的回复
+        if use_cache:
+            self.cache.put(key, "".join(parts))
+
+    async def astream_text(self, prompt: str, use_cache: bool = True,
+                           **kwargs: Any) -> AsyncIterator[str]:
+        """stream_text的异步版本"""
+        stop = kwargs.pop("stop", None)
+        key = self._cache_key(prompt, stop, kwargs)
+        cached = self._cache_lookup(key, use_cache)
+        if cached is not None:
+            yield cached
+            return
+        response = await self.aclient.chat.completions.create(
+            model='deepseek-chat',
+            messages=self._messages(prompt),
+            stream=True,
+            **self._request_params(stop, kwargs)
+        )
+        parts = []
+        try:
+            async for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    yield parts[-1]
+        finally:
+            await response.close()
+        if use_cache:
+            self.cache.put(key, "".join(parts))
+
     @property
     def _llm_type(self) -> str:
         return "deepseek_langchain_wrapper"
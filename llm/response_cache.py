@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+class ResponseCache:
+    """
+    LLM回复的精确匹配缓存
+    内存LRU为第一层，可选的SQLite文件为第二层；条目带TTL，两层各有容量上限
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = 3600,
+                 db_path: Optional[str] = None, max_disk_entries: int = 100_000):
+        """
+        初始化回复缓存
+        Args:
+            max_entries: 内存层最多缓存的条目数
+            ttl: 条目有效期（秒），None表示不过期
+            db_path: SQLite缓存文件路径，为None时只使用内存层
+            max_disk_entries: 磁盘层最多缓存的条目数
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_accessed ON responses (accessed_at)"
+            )
+            self._db.commit()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model: str, system: str, prompt: str, params: Dict[str, Any]) -> str:
+        """由模型、系统提示、用户提示和采样参数生成key"""
+        payload = json.dumps(
+            {"model": model, "system": system, "prompt": prompt, "params": params},
+            sort_keys=True, ensure_ascii=False, default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return entry[0]
+                del self._memory[key]
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    value, expires_at = row
+                    if expires_at > now:
+                        self._db.execute(
+                            "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key)
+                        )
+                        self._db.commit()
+                        self._remember(key, value, expires_at)
+                        self.disk_hits += 1
+                        return value
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._db.commit()
+            self.misses += 1
+            return None
+
+    def put(self, key: str, value: str) -> None:
+        now = time.time()
+        expires_at = now + self.ttl if self.ttl is not None else float("inf")
+        with self._lock:
+            self._remember(key, value, expires_at)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                    (key, value, expires_at, now)
+                )
+                # 超出容量时删除最久未访问的条目
+                self._db.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    "SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_disk_entries,)
+                )
+                self._db.commit()
+
+    def _remember(self, key: str, value: str, expires_at: float) -> None:
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    @property
+    def hits(self) -> int:
+        return self.memory_hits + self.disk_hits
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "memory_entries": len(self._memory),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+        }
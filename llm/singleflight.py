@@ -0,0 +1,107 @@
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+class _Call:
+    """一次正在执行的请求，后到的相同请求在event上等待其结果"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class _AsyncCall:
+    """一次正在执行的异步请求，请求在独立任务中执行，不属于任何一个调用方"""
+
+    def __init__(self, task: "asyncio.Task"):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    相同key的并发请求合并
+    某个key的请求执行期间，后续相同key的调用不再发起新请求，而是等待并共享第一个请求的结果
+    （包括异常）；请求结束后key即被释放，之后的调用会重新执行
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._async_calls: Dict[Tuple[int, Hashable], _AsyncCall] = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """
+        执行fn，或等待正在执行的相同key的请求
+        Args:
+            key: 请求的唯一标识
+            fn: 实际发起请求的无参函数
+        Returns:
+            fn的返回值
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+    async def ado(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        do的异步版本，在同一事件循环内合并相同key的协程
+        请求在独立任务中执行，所有调用方平等地等待它：某个调用方（包括发起者）被取消时
+        只有它自己收到CancelledError，请求继续为其他调用方执行；最后一个调用方被取消时才取消请求
+        """
+        loop = asyncio.get_running_loop()
+        slot = (id(loop), key)
+        call = self._async_calls.get(slot)
+        if call is None:
+            call = self._async_calls[slot] = _AsyncCall(loop.create_task(fn()))
+            self.executed += 1
+
+            def release(_task, call=call):
+                if self._async_calls.get(slot) is call:
+                    del self._async_calls[slot]
+
+            call.task.add_done_callback(release)
+        else:
+            self.coalesced += 1
+        call.waiters += 1
+        try:
+            # shield避免某个调用方被取消时连带取消共享的请求
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if call.waiters == 1 and not call.task.done():
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+
+    def stats(self) -> Dict[str, int]:
+        return {"executed": self.executed, "coalesced": self.coalesced}
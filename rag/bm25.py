@@ -0,0 +1,238 @@
+import heapq
+import math
+import re
+import threading
+from collections import Counter
+from typing import Collection, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import jieba  # 可选依赖，安装后使用分词结果代替双字切分
+    jieba.setLogLevel("WARNING")
+except ImportError:
+    jieba = None
+
+# 分词方式，决定缓存的倒排索引能否复用
+TOKENIZER = "jieba" if jieba is not None else "bigram"
+
+_ASCII_RE = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+_CJK_RE = re.compile(r"[㐀-䶿一-鿿豈-﫿]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    面向中英文混合文本的分词
+    英文和型号类词语整体保留并拆出子部分（如 "ab-1234" -> "ab-1234", "ab", "1234"），
+    中文优先使用jieba，未安装时退化为双字切分
+    """
+    text = text.lower()
+    tokens: List[str] = []
+    for word in _ASCII_RE.findall(text):
+        tokens.append(word)
+        parts = re.split(r"[-_./]", word)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part)
+    for run in _CJK_RE.findall(text):
+        if jieba is not None:
+            tokens.extend(word for word in jieba.lcut_for_search(run) if word.strip())
+        elif len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class BM25Segment:
+    """
+    一个分组（文档）的只读倒排索引
+    每个词的倒排表是CSR格式numpy数组中的一段：indptr[i]:indptr[i+1] 对应词i出现的文本块行号和词频，
+    可以直接pickle到磁盘，随向量索引一起缓存
+    """
+
+    def __init__(self, keys: List[str], lengths: np.ndarray, terms: Dict[str, int],
+                 indptr: np.ndarray, rows: np.ndarray, tfs: np.ndarray, tokenizer: str = TOKENIZER):
+        self.keys = keys
+        self.lengths = lengths
+        self.terms = terms  # 词 -> 词编号
+        self.indptr = indptr
+        self.rows = rows
+        self.tfs = tfs
+        self.tokenizer = tokenizer
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @classmethod
+    def from_texts(cls, items: Iterable[Tuple[str, str]]) -> "BM25Segment":
+        """
+        分词并构建倒排索引，不访问任何共享状态，可以在锁外执行
+        Args:
+            items: (文本块key, 文本)序列
+        """
+        keys: List[str] = []
+        lengths: List[int] = []
+        terms: Dict[str, int] = {}
+        term_ids: List[int] = []
+        rows: List[int] = []
+        tfs: List[int] = []
+        for row, (key, text) in enumerate(items):
+            counts = Counter(tokenize(text))
+            keys.append(key)
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                term_ids.append(terms.setdefault(term, len(terms)))
+                rows.append(row)
+                tfs.append(tf)
+        term_array = np.asarray(term_ids, dtype=np.int64)
+        # 稳定排序，同一个词的行号保持递增
+        order = np.argsort(term_array, kind="stable")
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_array, minlength=len(terms)), out=indptr[1:])
+        return cls(keys, np.asarray(lengths, dtype=np.float32), terms, indptr,
+                   np.asarray(rows, dtype=np.int32)[order], np.asarray(tfs, dtype=np.float32)[order])
+
+    def __getstate__(self) -> dict:
+        # 词表存为一个字符串（词中不含换行），比逐个pickle字典项快得多
+        state = dict(self.__dict__)
+        state["terms"] = "\n".join(self.terms)
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        terms = state["terms"].split("\n") if state["terms"] else []
+        state["terms"] = dict(zip(terms, range(len(terms))))
+        self.__dict__.update(state)
+
+    def document_frequencies(self) -> Iterable[Tuple[str, int]]:
+        counts = np.diff(self.indptr).tolist()
+        return zip(self.terms, counts)
+
+    def postings(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """词的(行号, 词频)数组，词不在该分组中时返回None"""
+        i = self.terms.get(term)
+        if i is None:
+            return None
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return self.rows[start:end], self.tfs[start:end]
+
+
+class BM25Index:
+    """
+    支持增量增删的BM25倒排索引
+    每个分组（文档ID）是一个只读的BM25Segment，增删以分组为单位；
+    检索时按词取出numpy倒排表，向量化累加得分，可限定分组范围
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, max_df: float = 0.5):
+        """
+        初始化BM25索引
+        Args:
+            k1: 词频饱和参数
+            b: 长度归一化参数
+            max_df: 出现在超过该比例文本块中的查询词不参与打分（查询词全部超过时仍保留），
+                这类词区分度很低，倒排表却最长
+        """
+        self.k1 = k1
+        self.b = b
+        self.max_df = max_df
+        self._segments: Dict[str, BM25Segment] = {}
+        self._df: Counter = Counter()  # 词 -> 包含该词的文本块数（所有分组）
+        self._count = 0
+        self._total_length = 0.0
+        self._norms: Dict[str, np.ndarray] = {}  # 分组 -> 长度归一化项，统计量变化时清空
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, group: str) -> bool:
+        return group in self._segments
+
+    def add(self, group: str, segment: BM25Segment) -> None:
+        """
+        添加分组
+        Args:
+            group: 分组（文档ID）
+            segment: 由BM25Segment.from_texts构建的倒排索引
+        """
+        with self._lock:
+            if group in self._segments:
+                return
+            self._segments[group] = segment
+            self._df.update(dict(segment.document_frequencies()))
+            self._count += len(segment)
+            self._total_length += float(segment.lengths.sum())
+            self._norms.clear()
+
+    def remove_group(self, group: str) -> None:
+        """删除整个分组的文本块"""
+        with self._lock:
+            segment = self._segments.pop(group, None)
+            if segment is None:
+                return
+            self._df.subtract(dict(segment.document_frequencies()))
+            for term in segment.terms:
+                if self._df[term] <= 0:
+                    del self._df[term]
+            self._count -= len(segment)
+            self._total_length -= float(segment.lengths.sum())
+            self._norms.clear()
+
+    def search(self, query: str, k: int = 4,
+               groups: Optional[Collection[str]] = None) -> List[Tuple[str, float]]:
+        """
+        检索最相关的文本块
+        Returns:
+            按得分降序排列的(文本块key, 得分)列表
+        """
+        terms = set(tokenize(query))
+        if not terms or not self._count:
+            return []
+        allowed = set(groups) if groups is not None else None
+        with self._lock:
+            n = self._count
+            if not n:
+                return []
+            avgdl = self._total_length / n
+            weights = self._idf(terms, n)
+            selected = [
+                (segment, self._norm(group, segment, avgdl))
+                for group, segment in self._segments.items()
+                if allowed is None or group in allowed
+            ]
+        # 分组只读，打分不需要持有锁
+        hits: List[Tuple[str, float]] = []
+        for segment, norm in selected:
+            hits.extend(self._score(segment, norm, weights, k))
+        return heapq.nlargest(k, hits, key=lambda item: item[1])
+
+    def _idf(self, terms: Iterable[str], n: int) -> List[Tuple[str, float]]:
+        """参与打分的查询词及其idf，跳过高频词"""
+        stats = [(term, self._df[term]) for term in terms if self._df.get(term)]
+        rare = [(term, df) for term, df in stats if df <= self.max_df * n]
+        return [
+            (term, math.log(1 + (n - df + 0.5) / (df + 0.5)))
+            for term, df in (rare or stats)
+        ]
+
+    def _norm(self, group: str, segment: BM25Segment, avgdl: float) -> np.ndarray:
+        norm = self._norms.get(group)
+        if norm is None:
+            norm = self.k1 * (1 - self.b + self.b * segment.lengths / avgdl)
+            self._norms[group] = norm
+        return norm
+
+    def _score(self, segment: BM25Segment, norm: np.ndarray,
+               weights: List[Tuple[str, float]], k: int) -> List[Tuple[str, float]]:
+        scores = np.zeros(len(segment), dtype=np.float32)
+        for term, idf in weights:
+            postings = segment.postings(term)
+            if postings is None:
+                continue
+            rows, tfs = postings
+            # 同一个词的行号互不相同，可以直接按下标累加
+            scores[rows] += idf * (self.k1 + 1) * tfs / (tfs + norm[rows])
+        hit = np.flatnonzero(scores)
+        if len(hit) > k:
+            hit = hit[np.argpartition(scores[hit], -k)[-k:]]
+        return [(segment.keys[row], float(scores[row])) for row in hit.tolist()]
@@ -0,0 +1,276 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """
+    文本块级别的向量缓存
+    向量以float32存放在内存映射文件中，随条目增加按倍数扩容；key到槽位的映射写入追加日志，
+    每次flush只追加新增的映射和命中的访问顺序，日志过长时按LRU顺序压缩重写，重启后淘汰顺序不变。
+    超过容量时按LRU淘汰并复用槽位：覆盖复用槽位之前先在日志中写入该槽位的失效标记，
+    中途崩溃时重放日志不会把新向量当作被淘汰key的向量。
+    同一缓存文件只允许一个进程写入：其他进程打开时通过文件锁检测到冲突，只在内存中缓存
+    """
+
+    FORMAT_VERSION = 2
+    INITIAL_ROWS = 1024
+
+    def __init__(self, cache_dir: str, model_name: str, max_entries: int = 100_000):
+        """
+        初始化向量缓存
+        Args:
+            cache_dir: 缓存目录
+            model_name: 向量化模型名称，不同模型使用不同的缓存文件
+            max_entries: 最多缓存的向量数
+        """
+        self.cache_dir = cache_dir
+        self.model_name = model_name
+        self.max_entries = max_entries
+        os.makedirs(cache_dir, exist_ok=True)
+        slug = re.sub(r"[^\w.-]+", "_", model_name)
+        self.data_path = os.path.join(cache_dir, f"{slug}.f32")
+        self.index_path = os.path.join(cache_dir, f"{slug}.json")
+        self.log_path = os.path.join(cache_dir, f"{slug}.log")
+        self._lock = threading.Lock()
+        self._slots: "OrderedDict[str, int]" = OrderedDict()  # 最近使用的在末尾
+        self._owners: Dict[int, str] = {}  # 槽位 -> key
+        self._next_slot = 0  # 尚未使用过的第一个槽位
+        self._free: List[int] = []  # 崩溃后留下的无主槽位
+        self._pending: "OrderedDict[str, int]" = OrderedDict()  # 尚未写入日志的映射和访问，按访问顺序
+        self._log_lines = 0
+        self._dim: Optional[int] = None
+        self._vectors: Optional[np.ndarray] = None
+        self.hits = 0
+        self.misses = 0
+        self._lock_file = None
+        self.persistent = self._acquire_file_lock(os.path.join(cache_dir, f"{slug}.lock"))
+        if self.persistent:
+            self._load()
+
+    def _acquire_file_lock(self, lock_path: str) -> bool:
+        """独占缓存文件，已被其他进程占用时返回False"""
+        try:
+            import fcntl
+        except ImportError:  # 非POSIX系统不加锁
+            return True
+        self._lock_file = open(lock_path, "a")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            logger.warning(f"向量缓存 {self.data_path} 正被其他进程使用，本进程只在内存中缓存")
+            self._lock_file.close()
+            self._lock_file = None
+            return False
+
+    def _load(self) -> None:
+        """读取已有的向量文件，并重放映射日志"""
+        if not (os.path.exists(self.index_path) and os.path.exists(self.data_path)):
+            return
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except json.JSONDecodeError:
+            return
+        if (meta.get("version") != self.FORMAT_VERSION or meta.get("model") != self.model_name
+                or meta.get("capacity") != self.max_entries):
+            # 格式或配置变化时丢弃旧缓存
+            return
+        self._dim = meta["dim"]
+        rows = os.path.getsize(self.data_path) // (4 * self._dim)
+        if not rows:
+            return
+        self._vectors = np.memmap(self.data_path, dtype=np.float32, mode="r+", shape=(rows, self._dim))
+        if not os.path.exists(self.log_path):
+            return
+        with open(self.log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) != 2 or not parts[1].isdigit():
+                    continue  # 中断时写了一半的行
+                self._log_lines += 1
+                key, slot = parts[0], int(parts[1])
+                if key == "-":
+                    # 槽位失效标记：槽位即将被复用，原来的key作废
+                    owner = self._owners.pop(slot, None)
+                    if owner is not None:
+                        self._slots.pop(owner, None)
+                elif slot < rows:
+                    self._assign(key, slot)
+        self._next_slot = max(self._owners) + 1 if self._owners else 0
+        self._free = [slot for slot in range(self._next_slot) if slot not in self._owners]
+
+    def _assign(self, key: str, slot: int) -> None:
+        """把槽位分配给key，槽位原来的key失效"""
+        previous = self._owners.get(slot)
+        if previous is not None and previous != key:
+            self._slots.pop(previous, None)
+        self._owners[slot] = key
+        self._slots[key] = slot
+        self._slots.move_to_end(key)
+
+    def _ensure_storage(self, dim: int) -> None:
+        if self._vectors is not None:
+            if dim != self._dim:
+                raise ValueError(f"向量维度不一致: 缓存为 {self._dim}，获取 {dim}")
+            return
+        self._dim = dim
+        rows = min(self.INITIAL_ROWS, self.max_entries)
+        self._slots.clear()
+        self._owners.clear()
+        self._free.clear()
+        self._next_slot = 0
+        if not self.persistent:
+            self._vectors = np.zeros((rows, dim), dtype=np.float32)
+            return
+        self._vectors = np.memmap(self.data_path, dtype=np.float32, mode="w+", shape=(rows, dim))
+        open(self.log_path, "w").close()
+        self._log_lines = 0
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": self.FORMAT_VERSION, "model": self.model_name,
+                       "dim": dim, "capacity": self.max_entries}, f)
+        os.replace(tmp_path, self.index_path)
+
+    def _grow(self, min_rows: int) -> None:
+        """向量存储扩容为原来的两倍（不超过容量）"""
+        rows = min(max(len(self._vectors) * 2, min_rows), self.max_entries)
+        if not self.persistent:
+            grown = np.zeros((rows, self._dim), dtype=np.float32)
+            grown[:len(self._vectors)] = self._vectors
+            self._vectors = grown
+            return
+        self._vectors.flush()
+        self._vectors = None
+        with open(self.data_path, "r+b") as f:
+            f.truncate(rows * self._dim * 4)
+        self._vectors = np.memmap(self.data_path, dtype=np.float32, mode="r+", shape=(rows, self._dim))
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """批量查询，未命中的位置返回None"""
+        results: List[Optional[List[float]]] = []
+        with self._lock:
+            for text in texts:
+                key = self.key(text)
+                slot = self._slots.get(key)
+                if slot is None or self._vectors is None:
+                    self.misses += 1
+                    results.append(None)
+                    continue
+                self._slots.move_to_end(key)
+                if self.persistent:
+                    # 记录访问顺序，重启后按LRU而不是写入顺序淘汰
+                    self._pending[key] = slot
+                    self._pending.move_to_end(key)
+                self.hits += 1
+                results.append(self._vectors[slot].tolist())
+        return results
+
+    def put_many(self, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        """批量写入，容量不足时淘汰最久未使用的向量"""
+        if not texts:
+            return
+        array = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            self._ensure_storage(array.shape[1])
+            slots = []
+            tombstones = []
+            for text in texts:
+                key = self.key(text)
+                slot = self._slots.get(key)
+                if slot is None:
+                    if self._free:
+                        slot = self._free.pop()
+                    elif self._next_slot < self.max_entries:
+                        slot = self._next_slot
+                        self._next_slot += 1
+                        if slot >= len(self._vectors):
+                            self._grow(slot + 1)
+                    else:
+                        evicted, slot = self._slots.popitem(last=False)
+                        self._pending.pop(evicted, None)
+                        tombstones.append(slot)
+                    self._assign(key, slot)
+                else:
+                    self._slots.move_to_end(key)
+                self._pending[key] = slot
+                self._pending.move_to_end(key)
+                slots.append(slot)
+            if tombstones and self.persistent:
+                # 先让日志记下复用槽位的旧映射已失效，再覆盖向量
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.writelines(f"- {slot}\n" for slot in tombstones)
+                self._log_lines += len(tombstones)
+            for slot, vector in zip(slots, array):
+                self._vectors[slot] = vector
+
+    def flush(self) -> None:
+        """
+        将新写入的向量和映射落盘：先刷新向量文件，再按访问顺序把映射追加到日志，
+        写入量只与新增和命中的条目数有关；日志行数超过有效条目的两倍时按LRU顺序压缩重写
+        """
+        with self._lock:
+            if self._vectors is None or not self.persistent or not self._pending:
+                return
+            self._vectors.flush()
+            if self._log_lines + len(self._pending) > 2 * len(self._slots) + self.INITIAL_ROWS:
+                tmp_path = f"{self.log_path}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    f.writelines(f"{key} {slot}\n" for key, slot in self._slots.items())
+                os.replace(tmp_path, self.log_path)
+                self._log_lines = len(self._slots)
+            else:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.writelines(f"{key} {slot}\n" for key, slot in self._pending.items())
+                self._log_lines += len(self._pending)
+            self._pending.clear()
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+
+class CachedEmbeddings(Embeddings):
+    """为任意Embeddings加上文本块级缓存，只对未命中的文本调用底层模型"""
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    @property
+    def model_name(self) -> str:
+        return self.cache.model_name
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.cache.get_many(texts)
+        # 同一批次中重复的文本只向量化一次
+        missing = list(dict.fromkeys(
+            text for text, vector in zip(texts, vectors) if vector is None
+        ))
+        if missing:
+            computed = dict(zip(missing, self.embeddings.embed_documents(missing)))
+            self.cache.put_many(missing, [computed[text] for text in missing])
+            vectors = [
+                computed[text] if vector is None else vector
+                for text, vector in zip(texts, vectors)
+            ]
+        # 命中时也要落盘访问顺序，没有待写内容时直接返回
+        self.cache.flush()
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+from typing import Any, Dict, Optional
+
+import faiss
+from langchain_community.vectorstores import FAISS
+
+
+class IndexCache:
+    """基于文件内容哈希的FAISS索引磁盘缓存"""
+
+    INDEX_FILE = "index.faiss"
+    STORE_FILE = "index.pkl"
+    META_FILE = "meta.json"
+    KEYWORD_FILE = "bm25.pkl"
+
+    def __init__(self, cache_dir: str = ".rag_cache"):
+        """
+        初始化索引缓存
+        Args:
+            cache_dir: 缓存根目录，每个索引占用一个以key命名的子目录
+        """
+        self.cache_dir = cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def file_hash(file_path: str, block_size: int = 1 << 20) -> str:
+        """分块计算文件内容的sha256，避免一次性读入大文件"""
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(block_size), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def make_key(content_hash: str, settings: Dict[str, Any]) -> str:
+        """由内容哈希和分割/向量化配置生成缓存key"""
+        payload = json.dumps(
+            {"content": content_hash, "settings": settings},
+            sort_keys=True, ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def contains(self, key: str) -> bool:
+        path = self._path(key)
+        return all(
+            os.path.exists(os.path.join(path, name))
+            for name in (self.INDEX_FILE, self.STORE_FILE)
+        )
+
+    def load(self, key: str, embeddings, mmap: bool = True) -> Optional[FAISS]:
+        """
+        读取缓存的索引
+        Args:
+            key: 缓存key
+            embeddings: 查询时使用的向量化模型
+            mmap: 是否以内存映射方式只读加载向量
+        Returns:
+            FAISS向量库，未命中时返回None
+        """
+        if not self.contains(key):
+            return None
+        path = self._path(key)
+        index_path = os.path.join(path, self.INDEX_FILE)
+        if mmap:
+            try:
+                index = faiss.read_index(
+                    index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+                )
+            except RuntimeError:
+                # 部分索引类型不支持mmap，退回普通加载
+                index = faiss.read_index(index_path)
+        else:
+            index = faiss.read_index(index_path)
+        with open(os.path.join(path, self.STORE_FILE), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        return FAISS(
+            embedding_function=embeddings,
+            index=index,
+            docstore=docstore,
+            index_to_docstore_id=index_to_docstore_id,
+        )
+
+    def load_keywords(self, key: str) -> Optional[Any]:
+        """读取与索引一起缓存的关键词索引，未缓存时返回None"""
+        path = os.path.join(self._path(key), self.KEYWORD_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    def save(self, key: str, db: FAISS, meta: Optional[Dict[str, Any]] = None,
+             keywords: Optional[Any] = None) -> None:
+        """
+        写入索引缓存，先写临时目录再原子替换，避免并发读到半成品
+        Args:
+            key: 缓存key
+            db: FAISS向量库
+            meta: 写入meta.json的描述信息
+            keywords: 文档的关键词索引，缓存命中时无需重新分词
+        """
+        tmp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=self.cache_dir)
+        try:
+            faiss.write_index(db.index, os.path.join(tmp_dir, self.INDEX_FILE))
+            with open(os.path.join(tmp_dir, self.STORE_FILE), "wb") as f:
+                pickle.dump((db.docstore, db.index_to_docstore_id), f)
+            if keywords is not None:
+                with open(os.path.join(tmp_dir, self.KEYWORD_FILE), "wb") as f:
+                    pickle.dump(keywords, f, protocol=pickle.HIGHEST_PROTOCOL)
+            with open(os.path.join(tmp_dir, self.META_FILE), "w", encoding="utf-8") as f:
+                json.dump(meta or {}, f, ensure_ascii=False, indent=2)
+            target = self._path(key)
+            if os.path.exists(target):
+                shutil.rmtree(target, ignore_errors=True)
+            os.replace(tmp_dir, target)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+    def remove(self, key: str) -> bool:
+        path = self._path(key)
+        if not os.path.exists(path):
+            return False
+        shutil.rmtree(path, ignore_errors=True)
+        return True
+
+    def clear(self) -> None:
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        os.makedirs(self.cache_dir, exist_ok=True)
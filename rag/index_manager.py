@@ -0,0 +1,223 @@
+import heapq
+import logging
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from rag.bm25 import TOKENIZER, BM25Index, BM25Segment
+
+logger = logging.getLogger(__name__)
+
+
+def index_nbytes(index) -> int:
+    """估算FAISS索引中向量数据占用的内存"""
+    try:
+        code_size = index.sa_code_size()
+    except (AttributeError, RuntimeError):
+        code_size = index.d * 4
+    return int(code_size) * int(index.ntotal)
+
+
+class IndexManager:
+    """
+    多文档索引管理器
+    每个文档以自己的ID独立保存一个FAISS索引，重复文档不会重复入库，
+    超过向量数或内存预算时按LRU淘汰最久未使用的文档。
+    所有文档的文本块同时登记到一个BM25倒排索引，用于关键词与向量的混合检索
+    """
+
+    def __init__(self, max_vectors: Optional[int] = None, max_bytes: Optional[int] = None,
+                 rrf_k: int = 60):
+        """
+        初始化索引管理器
+        Args:
+            max_vectors: 所有文档向量总数上限，None表示不限制
+            max_bytes: 所有文档向量内存估算上限，None表示不限制
+            rrf_k: 倒数排名融合(RRF)的平滑常数
+        """
+        self.max_vectors = max_vectors
+        self.max_bytes = max_bytes
+        self.rrf_k = rrf_k
+        self.keyword_index = BM25Index()
+        self._stores: "OrderedDict[str, FAISS]" = OrderedDict()  # 最近使用的在末尾
+        self._sizes: Dict[str, Tuple[int, int]] = {}  # doc_id -> (向量数, 字节数)
+        self._pins: Counter = Counter()  # doc_id -> 固定次数，被固定的文档不会被淘汰
+        self._lock = threading.RLock()
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._stores
+
+    def __len__(self) -> int:
+        return len(self._stores)
+
+    @property
+    def doc_ids(self) -> List[str]:
+        return list(self._stores.keys())
+
+    @property
+    def total_vectors(self) -> int:
+        return sum(vectors for vectors, _ in self._sizes.values())
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(nbytes for _, nbytes in self._sizes.values())
+
+    def add(self, doc_id: str, db: FAISS, keywords: Optional[BM25Segment] = None) -> List[str]:
+        """
+        添加文档索引，已存在时仅刷新其使用时间
+        Args:
+            doc_id: 文档ID
+            db: 文档的FAISS索引
+            keywords: 缓存中读出的关键词索引，省略或分词方式不一致时重新分词构建
+        Returns:
+            因超出预算被淘汰的文档ID列表
+        """
+        with self._lock:
+            if doc_id in self._stores:
+                self._stores.move_to_end(doc_id)
+                return []
+        # 分词耗时较长，在锁外完成，不阻塞其他文档的检索和入库
+        if keywords is None or keywords.tokenizer != TOKENIZER:
+            keywords = self.keyword_segment(doc_id, db)
+        with self._lock:
+            if doc_id in self._stores:
+                # 分词期间其他线程已登记同一文档
+                self._stores.move_to_end(doc_id)
+                return []
+            # 向量索引和关键词索引在同一把锁内一起登记，淘汰和删除总是看到两者同时存在
+            self._stores[doc_id] = db
+            self._sizes[doc_id] = (db.index.ntotal, index_nbytes(db.index))
+            self.keyword_index.add(doc_id, keywords)
+            return self._evict(keep=doc_id)
+
+    def get(self, doc_id: str) -> FAISS:
+        with self._lock:
+            if doc_id not in self._stores:
+                raise ValueError(f"文档 {doc_id} 未加载或已被淘汰")
+            self._stores.move_to_end(doc_id)
+            return self._stores[doc_id]
+
+    def remove(self, doc_id: str) -> bool:
+        with self._lock:
+            if doc_id not in self._stores:
+                return False
+            del self._stores[doc_id]
+            del self._sizes[doc_id]
+            self.keyword_index.remove_group(doc_id)
+            return True
+
+    @contextmanager
+    def pinned(self, doc_id: str) -> Iterator[str]:
+        """
+        在上下文内固定文档，期间其他文档入库不会将其淘汰；文档可以尚未加载
+        Args:
+            doc_id: 文档ID
+        """
+        with self._lock:
+            self._pins[doc_id] += 1
+        try:
+            yield doc_id
+        finally:
+            with self._lock:
+                self._pins[doc_id] -= 1
+                if self._pins[doc_id] <= 0:
+                    del self._pins[doc_id]
+
+    def _over_budget(self) -> bool:
+        if self.max_vectors is not None and self.total_vectors > self.max_vectors:
+            return True
+        if self.max_bytes is not None and self.total_bytes > self.max_bytes:
+            return True
+        return False
+
+    def _evict(self, keep: str) -> List[str]:
+        evicted = []
+        while self._over_budget():
+            victim = next((doc_id for doc_id in self._stores
+                           if doc_id != keep and doc_id not in self._pins), None)
+            if victim is None:
+                break
+            self.remove(victim)
+            evicted.append(victim)
+            logger.info(f"索引超出预算，淘汰文档: {victim}")
+        return evicted
+
+    @classmethod
+    def keyword_segment(cls, doc_id: str, db: FAISS) -> BM25Segment:
+        """为文档构建关键词索引，可随向量索引一起缓存"""
+        return BM25Segment.from_texts(cls._iter_chunks(doc_id, db))
+
+    @staticmethod
+    def _iter_chunks(doc_id: str, db: FAISS) -> Iterator[Tuple[str, str]]:
+        for docstore_id in db.index_to_docstore_id.values():
+            yield f"{doc_id}:{docstore_id}", db.docstore.search(docstore_id).page_content
+
+    def _selected(self, doc_ids: Optional[Sequence[str]]) -> List[Tuple[str, FAISS]]:
+        """获取选中文档的索引，doc_ids为None时返回全部"""
+        with self._lock:
+            if doc_ids is None:
+                return list(self._stores.items())
+            return [(doc_id, self.get(doc_id)) for doc_id in doc_ids]
+
+    def document(self, key: str) -> Document:
+        """根据"文档ID:文本块ID"获取文本块"""
+        doc_id, docstore_id = key.split(":", 1)
+        return self._stores[doc_id].docstore.search(docstore_id)
+
+    def vector_search(self, embeddings: Sequence[Sequence[float]], k: int = 4,
+                      doc_ids: Optional[Sequence[str]] = None) -> List[List[Tuple[str, float]]]:
+        """
+        向量检索，所有查询在每个文档索引上作为一个矩阵一次性检索
+        Returns:
+            每个查询按相似度降序排列的(文本块key, 距离)列表
+        """
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        results: List[List[Tuple[str, float]]] = [[] for _ in range(len(matrix))]
+        for doc_id, db in self._selected(doc_ids):
+            if not db.index.ntotal:
+                continue
+            # 统一为越小越相似
+            sign = -1.0 if db.index.metric_type == faiss.METRIC_INNER_PRODUCT else 1.0
+            distances, indices = db.index.search(matrix, min(k, db.index.ntotal))
+            for row, (row_distances, row_indices) in enumerate(zip(distances, indices)):
+                for distance, i in zip(row_distances, row_indices):
+                    if i == -1:
+                        continue
+                    key = f"{doc_id}:{db.index_to_docstore_id[i]}"
+                    results[row].append((key, sign * float(distance)))
+        return [sorted(hits, key=lambda hit: hit[1])[:k] for hits in results]
+
+    def search(self, queries: Sequence[str], embeddings: Sequence[Sequence[float]], k: int = 4,
+               doc_ids: Optional[Sequence[str]] = None, hybrid: bool = True,
+               candidates: Optional[int] = None) -> List[List[Document]]:
+        """
+        批量检索，hybrid为True时以RRF融合向量检索和BM25关键词检索的结果
+        Args:
+            queries: 查询文本
+            embeddings: 与queries对应的查询向量
+            k: 每个查询返回的文本块数
+            doc_ids: 限定检索的文档ID
+            hybrid: 是否融合关键词检索
+            candidates: 每路召回参与融合的候选数，默认为2k
+        """
+        candidates = candidates or 2 * k
+        vector_hits = self.vector_search(embeddings, candidates if hybrid else k, doc_ids)
+        results = []
+        for query, hits in zip(queries, vector_hits):
+            if not hybrid:
+                results.append([self.document(key) for key, _ in hits])
+                continue
+            fused: Dict[str, float] = defaultdict(float)
+            for rank, (key, _) in enumerate(hits):
+                fused[key] += 1.0 / (self.rrf_k + rank + 1)
+            for rank, (key, _) in enumerate(self.keyword_index.search(query, candidates, doc_ids)):
+                fused[key] += 1.0 / (self.rrf_k + rank + 1)
+            top = heapq.nlargest(k, fused.items(), key=lambda item: item[1])
+            results.append([self.document(key) for key, _ in top])
+        return results
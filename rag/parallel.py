@@ -0,0 +1,68 @@
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import pdfplumber
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+# 进程池worker函数需定义在模块顶层，保证可被pickle
+
+
+def count_pages(file_path: str) -> int:
+    """获取PDF页数"""
+    with pdfplumber.open(file_path) as pdf:
+        return len(pdf.pages)
+
+
+def page_ranges(total_pages: int, pages_per_task: int) -> List[Tuple[int, int]]:
+    """将页码切分为左闭右开的区间"""
+    return [
+        (start, min(start + pages_per_task, total_pages))
+        for start in range(0, total_pages, pages_per_task)
+    ]
+
+
+def iter_pages(file_path: str, start: int = 0,
+               end: Optional[int] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    逐页提取[start, end)页的文本，每页处理完即释放pdfplumber缓存的页面对象
+    文本和元数据与PDFPlumberLoader完全一致，保证不同入库方式得到相同的文本块
+    Returns:
+        按页序产出的(页面文本, 元数据)
+    """
+    with pdfplumber.open(file_path) as pdf:
+        doc_metadata = {
+            k: v for k, v in pdf.metadata.items()
+            if type(v) in (str, int)
+        }
+        total_pages = len(pdf.pages)
+        for page_no in range(start, total_pages if end is None else end):
+            page = pdf.pages[page_no]
+            try:
+                text = page.extract_text() + "\n"
+            finally:
+                page.close()
+            metadata = {
+                "source": file_path,
+                "file_path": file_path,
+                "page": page_no,
+                "total_pages": total_pages,
+                **doc_metadata,
+            }
+            yield text, metadata
+
+
+def extract_page_range(file_path: str, start: int, end: int,
+                       chunk_size: int, chunk_overlap: int) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    在子进程中解析并分割[start, end)页
+    Returns:
+        按页序排列的(文本块, 元数据)列表，与PDFPlumberLoader加载后分割的结果一致
+    """
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap
+    )
+    results: List[Tuple[str, Dict[str, Any]]] = []
+    for text, metadata in iter_pages(file_path, start, end):
+        for chunk in splitter.split_text(text):
+            results.append((chunk, dict(metadata)))
+    return results
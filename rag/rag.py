@@ -1,29 +1,98 @@
 from langchain_community.document_loaders import PDFPlumberLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.embeddings import HuggingFaceEmbeddings
+from langchain_community.embeddings.huggingface import DEFAULT_MODEL_NAME
 from langchain_community.vectorstores import FAISS
-from langchain.chains import RetrievalQA
 from langchain_core.prompts import PromptTemplate
+from langchain_core.documents import Document
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Iterator, List, Optional, Sequence, Tuple
+import asyncio
+import logging
+import threading
 import warnings
 import os
 import sys
 
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-sys.path.append(project_root)
+sys.path.insert(0, project_root)
 from llm.base_model import LanguageModel
+from rag.bm25 import BM25Segment
+from rag.index_cache import IndexCache
+from rag.embedding_cache import CachedEmbeddings, EmbeddingCache
+from rag.index_manager import IndexManager
+from rag.semantic_cache import SemanticCache
+from rag.vector_index import IndexSpec, SharedCodebook, VectorIndexBuilder
+from rag import parallel
+from callback.callback import CallbackHandler
 warnings.filterwarnings("ignore")
+logger = logging.getLogger(__name__)
+
 class RAG:
-    def __init__(self):
+    def __init__(self, cache_dir: Optional[str] = ".rag_cache",
+                 chunk_size: int = 1000, chunk_overlap: int = 200,
+                 streaming: bool = False, batch_size: int = 64,
+                 callback: Optional[CallbackHandler] = None,
+                 embedding_cache_dir: Optional[str] = ".embedding_cache",
+                 embedding_cache_size: int = 100_000,
+                 max_vectors: Optional[int] = None, max_index_bytes: Optional[int] = None,
+                 hybrid: bool = True,
+                 semantic_cache_threshold: Optional[float] = 0.95,
+                 semantic_cache_ttl: Optional[float] = 3600,
+                 semantic_cache_size: int = 1024,
+                 index_spec: Optional[IndexSpec] = None,
+                 embedding_model: str = DEFAULT_MODEL_NAME,
+                 language_model: Optional[LanguageModel] = None):
+        """
+        初始化RAG引擎
+        Args:
+            cache_dir: 索引缓存目录，为None时不启用磁盘缓存
+            chunk_size: 文本块大小
+            chunk_overlap: 文本块重叠长度
+            streaming: 是否默认使用流式（逐页、分批向量化）入库
+            batch_size: 流式入库时每批向量化的文本块数
+            callback: 回调处理器，用于上报入库进度
+            embedding_cache_dir: 文本块向量缓存目录，为None时不启用
+            embedding_cache_size: 向量缓存最多保留的文本块数
+            max_vectors: 内存中所有文档索引的向量总数上限
+            max_index_bytes: 内存中所有文档索引的内存估算上限
+            hybrid: 是否融合BM25关键词检索与向量检索
+            semantic_cache_threshold: 语义答案缓存的命中相似度阈值，为None时不启用
+            semantic_cache_ttl: 语义答案缓存的有效期（秒）
+            semantic_cache_size: 语义答案缓存的最大条目数
+            index_spec: 向量索引类型与量化配置，默认为Flat精确索引
+            embedding_model: HuggingFace向量化模型名称，模型在首次使用时加载
+            language_model: 共享的语言模型，默认新建
+        """
         self.documents = []
+        self.hybrid = hybrid
+        self.index_spec = index_spec or IndexSpec()
+        self.codebook = SharedCodebook(self.index_spec)  # 所有文档共享的聚类中心/量化码本
+        self.streaming = streaming
+        self.batch_size = batch_size
+        self.callback = callback or CallbackHandler(name="RAGCallback")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
         self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap
         )
-        self.embeddings = HuggingFaceEmbeddings()
-        self.db = None  # 延迟初始化
-        self.qa = None
-        self.llm = LanguageModel().get_llm()
-        
+        self.embedding_model = embedding_model
+        self.embedding_cache_dir = embedding_cache_dir
+        self.embedding_cache_size = embedding_cache_size
+        self._embeddings = None  # 加载模型较慢，延迟到首次使用
+        self._init_lock = threading.Lock()
+        self.index_cache = IndexCache(cache_dir) if cache_dir else None
+        self.index_manager = IndexManager(max_vectors=max_vectors, max_bytes=max_index_bytes)
+        self.semantic_cache = None
+        if semantic_cache_threshold is not None:
+            self.semantic_cache = SemanticCache(
+                threshold=semantic_cache_threshold,
+                ttl=semantic_cache_ttl,
+                max_entries=semantic_cache_size
+            )
+        self.language_model = language_model or LanguageModel()
+
         # 定义prompt模板
         self.prompt_template = PromptTemplate.from_template(
             """请用中文回答，并遵循以下规则：
@@ -36,40 +105,322 @@ class RAG:
             答案："""
         )
 
-    def load_document(self, file):
-        """加载并索引文档"""
+    @property
+    def embeddings(self):
+        """向量化模型，首次访问时加载"""
+        if self._embeddings is None:
+            with self._init_lock:
+                if self._embeddings is None:
+                    embeddings = HuggingFaceEmbeddings(model_name=self.embedding_model)
+                    if self.embedding_cache_dir:
+                        # 文档修订后只需向量化发生变化的文本块
+                        embeddings = CachedEmbeddings(
+                            embeddings,
+                            EmbeddingCache(self.embedding_cache_dir, self.embedding_model,
+                                           max_entries=self.embedding_cache_size)
+                        )
+                    self._embeddings = embeddings
+        return self._embeddings
+
+    @property
+    def llm(self):
+        return self.language_model.get_llm()
+
+    @property
+    def index_settings(self) -> dict:
+        """影响索引内容的配置，作为缓存key的一部分"""
+        return {
+            "splitter": type(self.text_splitter).__name__,
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap,
+            "embeddings": self.embedding_model,
+            "index": self.index_spec.settings(),
+        }
+
+    @staticmethod
+    def document_id(file) -> str:
+        """计算文档ID（文件内容哈希），可在加载前用于固定文档"""
+        return IndexCache.file_hash(file)
+
+    def load_document(self, file, use_cache: bool = True, streaming: Optional[bool] = None,
+                      doc_id: Optional[str] = None) -> str:
+        """
+        加载并索引文档，已加载过的相同内容的文档不会重复入库
+        Args:
+            file: PDF文件路径
+            use_cache: 是否使用磁盘索引缓存
+            streaming: 是否流式入库，默认沿用初始化配置
+            doc_id: 已由document_id()计算的文档ID，省略时重新计算
+        Returns:
+            文档ID（文件内容哈希）
+        """
+        doc_id = doc_id or self.document_id(file)
+        if doc_id not in self.index_manager:
+            cache_key = self._cache_key(doc_id) if use_cache else None
+            db, keywords = self._load_cached(file, cache_key) if cache_key else (None, None)
+            if db is None:
+                streaming = self.streaming if streaming is None else streaming
+                if streaming:
+                    db = self._build_index_streaming(file)
+                else:
+                    db = self._build_index(file)
+                keywords = self.index_manager.keyword_segment(doc_id, db)
+                self._save_cached(file, cache_key, db, keywords)
+            self.index_manager.add(doc_id, db, keywords)
+        else:
+            self.index_manager.get(doc_id)  # 刷新LRU顺序
+        return doc_id
+
+    def load_documents(self, files: Sequence[str], use_cache: bool = True,
+                       max_workers: Optional[int] = None, pages_per_task: int = 16) -> List[str]:
+        """
+        使用进程池并行解析、分割一个或多个PDF，每个文档的文本块按页码顺序入库
+        Args:
+            files: PDF文件路径列表
+            use_cache: 是否使用磁盘索引缓存
+            max_workers: 进程数，默认为CPU核数
+            pages_per_task: 每个子任务处理的页数
+        Returns:
+            与files顺序一致的文档ID列表
+        """
+        doc_ids = [IndexCache.file_hash(file) for file in files]
+        pending = []
+        for file, doc_id in zip(files, doc_ids):
+            if doc_id in self.index_manager or any(doc_id == d for _, d, _ in pending):
+                continue
+            cache_key = self._cache_key(doc_id) if use_cache else None
+            db, keywords = self._load_cached(file, cache_key) if cache_key else (None, None)
+            if db is not None:
+                self.index_manager.add(doc_id, db, keywords)
+                continue
+            pending.append((file, doc_id, cache_key))
+
+        if pending:
+            page_counts = {file: parallel.count_pages(file) for file, _, _ in pending}
+            tasks = [
+                (file, start, end)
+                for file, _, _ in pending
+                for start, end in parallel.page_ranges(page_counts[file], pages_per_task)
+            ]
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                # map按提交顺序返回结果，保证合并顺序确定
+                results = executor.map(
+                    parallel.extract_page_range,
+                    *zip(*tasks),
+                    [self.chunk_size] * len(tasks),
+                    [self.chunk_overlap] * len(tasks),
+                )
+                chunks_by_file = {file: [] for file, _, _ in pending}
+                for (file, _, _), task_chunks in zip(tasks, results):
+                    chunks_by_file[file].extend(task_chunks)
+
+            for file, doc_id, cache_key in pending:
+                builder = VectorIndexBuilder(self.index_spec, self.embeddings, self.codebook)
+                chunks = chunks_by_file.pop(file)
+                for i in range(0, len(chunks), self.batch_size):
+                    batch = [Document(page_content=text, metadata=metadata)
+                             for text, metadata in chunks[i:i + self.batch_size]]
+                    self._append_batch(builder, batch)
+                db = builder.finish()
+                if db is None:
+                    raise ValueError(f"文档分割后未得到有效文本块: {file}")
+                self.callback.on_rag_progress(file, page_counts[file], len(chunks), done=True)
+                keywords = self.index_manager.keyword_segment(doc_id, db)
+                self._save_cached(file, cache_key, db, keywords)
+                self.index_manager.add(doc_id, db, keywords)
+
+        return doc_ids
+
+    def _cache_key(self, doc_id: str) -> Optional[str]:
+        """计算文档的缓存key，未启用缓存时返回None"""
+        if self.index_cache is None:
+            return None
+        return IndexCache.make_key(doc_id, self.index_settings)
+
+    def _load_cached(self, file, cache_key: str) -> Tuple[Optional[FAISS], Optional[BM25Segment]]:
+        """尝试从缓存加载文档索引及其关键词索引，未命中时返回(None, None)"""
+        # 每个文档的索引独立且只读，可以直接内存映射
+        cached = self.index_cache.load(cache_key, self.embeddings, mmap=True)
+        if cached is None:
+            return None, None
+        logger.info(f"命中索引缓存: {file}")
+        self.index_spec.apply_search_params(cached.index)
+        return cached, self.index_cache.load_keywords(cache_key)
+
+    def _save_cached(self, file, cache_key: Optional[str], db: FAISS,
+                     keywords: Optional[BM25Segment] = None):
+        if cache_key:
+            self.index_cache.save(cache_key, db, meta={"file": os.path.basename(file),
+                                                       **self.index_settings},
+                                  keywords=keywords)
+
+    def _build_index(self, file) -> FAISS:
+        """一次性解析、分割并向量化整个文档"""
         loader = PDFPlumberLoader(file)
         documents = loader.load()
         chunks = self.text_splitter.split_documents(documents)
         
         if not chunks:
             raise ValueError("文档分割后未得到有效文本块")
-        # 首次加载时初始化FAISS
-        if self.db is None:
-            self.db = FAISS.from_documents(chunks, self.embeddings)
-        else:
-            self.db.add_documents(chunks)
-        
-        self._init_qa_chain()
-
-    def _init_qa_chain(self):
-        """初始化QA链"""
-        if not self.db:
-            raise ValueError("请先加载文档")
-        # 现在 self.llm 已经是符合 LangChain 要求的 LLM 对象
-        self.qa = RetrievalQA.from_chain_type(
-            llm=self.llm,
-            chain_type="stuff",
-            retriever=self.db.as_retriever(search_kwargs={"k": 4}),
-            chain_type_kwargs={"prompt": self.prompt_template},
-            return_source_documents=True
-        )
+        builder = VectorIndexBuilder(self.index_spec, self.embeddings, self.codebook)
+        self._append_batch(builder, chunks)
+        db = builder.finish()
+        self.callback.on_rag_progress(file, len(documents), len(chunks))
+        return db
+
+    def _iter_pages(self, file) -> Iterator[Tuple[int, List[Document]]]:
+        """逐页提取并分割文档，产出(页码, 该页文本块)；每次只解析一页，解析完即释放页面"""
+        for page_no, (text, metadata) in enumerate(parallel.iter_pages(file), start=1):
+            yield page_no, self.text_splitter.split_documents(
+                [Document(page_content=text, metadata=metadata)]
+            )
+
+    def _build_index_streaming(self, file) -> FAISS:
+        """
+        流式构建索引：逐页分割，按固定批次向量化并追加到索引，
+        内存中最多只保留一页和一个批次的文本块，每处理完一页报告一次进度
+        """
+        builder = VectorIndexBuilder(self.index_spec, self.embeddings, self.codebook)
+        batch: List[Document] = []
+        pages = chunks = 0
+        for pages, page_chunks in self._iter_pages(file):
+            for chunk in page_chunks:
+                batch.append(chunk)
+                if len(batch) >= self.batch_size:
+                    self._append_batch(builder, batch)
+                    batch = []
+            chunks += len(page_chunks)
+            self.callback.on_rag_progress(file, pages, chunks)
+        if batch:
+            self._append_batch(builder, batch)
+        db = builder.finish()
+        if db is None:
+            raise ValueError("文档分割后未得到有效文本块")
+        self.callback.on_rag_progress(file, pages, chunks, done=True)
+        return db
+
+    def _append_batch(self, builder: VectorIndexBuilder, batch: List[Document]):
+        """向量化一个批次并追加到索引"""
+        texts = [doc.page_content for doc in batch]
+        metadatas = [doc.metadata for doc in batch]
+        builder.add(texts, self.embeddings.embed_documents(texts), metadatas)
 
-    def retrieve_and_generate(self, query):
-        """检索并生成答案"""
-        if not self.qa:
+    def retrieve_and_generate(self, query, doc_ids: Optional[Sequence[str]] = None):
+        """
+        检索并生成答案
+        Args:
+            query: 用户问题
+            doc_ids: 限定检索的文档ID，默认检索全部已加载文档
+        """
+        if not len(self.index_manager):
             raise ValueError("请先调用load_document()加载文档")
-        return self.qa.invoke({"query": query})["result"]
+        # 查询向量只计算一次，同时用于语义缓存和检索
+        embedding = self.embeddings.embed_query(query)
+        namespace = self._cache_namespace(doc_ids)
+        if self.semantic_cache is not None:
+            cached = self.semantic_cache.get(namespace, embedding)
+            if cached is not None:
+                logger.info("命中语义答案缓存")
+                return cached
+        result = self._generate(query, embedding, doc_ids)
+        if self.semantic_cache is not None:
+            self.semantic_cache.put(namespace, embedding, result)
+        return result
+
+    async def aretrieve_and_generate(self, query, doc_ids: Optional[Sequence[str]] = None) -> str:
+        """retrieve_and_generate的异步版本，向量化在线程中执行，LLM调用走异步客户端"""
+        if not len(self.index_manager):
+            raise ValueError("请先调用load_document()加载文档")
+        embedding = await asyncio.to_thread(self.embeddings.embed_query, query)
+        namespace = self._cache_namespace(doc_ids)
+        if self.semantic_cache is not None:
+            cached = self.semantic_cache.get(namespace, embedding)
+            if cached is not None:
+                logger.info("命中语义答案缓存")
+                return cached
+        docs = self.index_manager.search([query], [embedding], k=4,
+                                         doc_ids=doc_ids, hybrid=self.hybrid)[0]
+        result = (await self.llm.ainvoke(self._build_prompt(query, docs))).content
+        if self.semantic_cache is not None:
+            self.semantic_cache.put(namespace, embedding, result)
+        return result
+
+    def _cache_namespace(self, doc_ids: Optional[Sequence[str]]) -> tuple:
+        """语义缓存的命名空间，由检索的文档范围决定"""
+        if doc_ids is None:
+            doc_ids = self.index_manager.doc_ids
+        return tuple(sorted(doc_ids))
+
+    def batch_retrieve_and_generate(self, queries: Sequence[str],
+                                    doc_ids: Optional[Sequence[str]] = None,
+                                    max_concurrency: int = 4) -> List[str]:
+        """
+        批量检索并生成答案
+        所有问题一次批量向量化、在每个文档索引上一次矩阵检索，
+        再以有限并发调用LLM生成
+        Args:
+            queries: 问题列表
+            doc_ids: 限定检索的文档ID，默认检索全部已加载文档
+            max_concurrency: LLM并发调用数上限
+        Returns:
+            与queries顺序一致的答案列表
+        """
+        if not len(self.index_manager):
+            raise ValueError("请先调用load_document()加载文档")
+        if not queries:
+            return []
+        embeddings = self._embed_queries(queries)
+        namespace = self._cache_namespace(doc_ids)
+        answers: List[Optional[str]] = [None] * len(queries)
+        if self.semantic_cache is not None:
+            for i, embedding in enumerate(embeddings):
+                answers[i] = self.semantic_cache.get(namespace, embedding)
+        pending = [i for i, answer in enumerate(answers) if answer is None]
+        if not pending:
+            return answers
+
+        docs = self.index_manager.search(
+            [queries[i] for i in pending], [embeddings[i] for i in pending],
+            k=4, doc_ids=doc_ids, hybrid=self.hybrid
+        )
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            results = executor.map(
+                lambda args: self._complete(*args),
+                [(queries[i], i_docs) for i, i_docs in zip(pending, docs)]
+            )
+            for i, result in zip(pending, results):
+                answers[i] = result
+                if self.semantic_cache is not None:
+                    self.semantic_cache.put(namespace, embeddings[i], result)
+        return answers
+
+    def _embed_queries(self, queries: Sequence[str]) -> List[List[float]]:
+        """
+        批量向量化查询
+        模型对查询没有单独的指令前缀时，查询与文档的向量化方式相同，一次批量前向完成；
+        否则逐个调用embed_query。查询直接交给底层模型，不写入文本块缓存
+        """
+        model = getattr(self.embeddings, "embeddings", self.embeddings)  # CachedEmbeddings包装的底层模型
+        if getattr(model, "query_instruction", None):
+            return [self.embeddings.embed_query(query) for query in queries]
+        return model.embed_documents(list(queries))
+
+    def _generate(self, query: str, embedding, doc_ids: Optional[Sequence[str]]) -> str:
+        """检索相关文本块并生成答案"""
+        docs = self.index_manager.search([query], [embedding], k=4,
+                                         doc_ids=doc_ids, hybrid=self.hybrid)[0]
+        return self._complete(query, docs)
+
+    def _complete(self, query: str, docs: List[Document]) -> str:
+        """调用LLM生成答案"""
+        return self.llm.invoke(self._build_prompt(query, docs)).content
+
+    def _build_prompt(self, query: str, docs: List[Document]) -> str:
+        """按stuff方式将文本块拼入prompt"""
+        return self.prompt_template.format(
+            context="\n\n".join(doc.page_content for doc in docs),
+            question=query
+        )
 
 if __name__ == "__main__":
     rag = RAG()
@@ -0,0 +1,100 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class SemanticCache:
+    """
+    语义答案缓存
+    按命名空间（文档范围）保存问题向量和答案，新问题与已有问题的余弦相似度
+    超过阈值时直接返回已有答案；条目带TTL，超过容量时按LRU淘汰
+    """
+
+    def __init__(self, threshold: float = 0.95, ttl: Optional[float] = 3600,
+                 max_entries: int = 1024):
+        """
+        初始化语义缓存
+        Args:
+            threshold: 命中所需的最小余弦相似度
+            ttl: 条目有效期（秒），None表示不过期
+            max_entries: 最多缓存的条目数
+        """
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # 条目ID -> (命名空间, 单位向量, 答案, 过期时间)
+        self._entries: "OrderedDict[int, Tuple[Hashable, np.ndarray, str, float]]" = OrderedDict()
+        self._namespaces: Dict[Hashable, Dict[int, None]] = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(vector: Sequence[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else array
+
+    def _drop(self, entry_id: int) -> None:
+        namespace = self._entries.pop(entry_id)[0]
+        ids = self._namespaces[namespace]
+        del ids[entry_id]
+        if not ids:
+            del self._namespaces[namespace]
+
+    def get(self, namespace: Hashable, vector: Sequence[float]) -> Optional[str]:
+        """查找语义相近的问题的答案，未命中返回None"""
+        query = self._normalize(vector)
+        now = time.time()
+        with self._lock:
+            ids = []
+            for entry_id in list(self._namespaces.get(namespace, ())):
+                if self._entries[entry_id][3] > now:
+                    ids.append(entry_id)
+                else:
+                    self._drop(entry_id)
+            if ids:
+                matrix = np.stack([self._entries[entry_id][1] for entry_id in ids])
+                scores = matrix @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self._entries.move_to_end(ids[best])
+                    self.hits += 1
+                    return self._entries[ids[best]][2]
+            self.misses += 1
+            return None
+
+    def put(self, namespace: Hashable, vector: Sequence[float], answer: str) -> None:
+        expires_at = time.time() + self.ttl if self.ttl is not None else float("inf")
+        with self._lock:
+            entry_id = next(self._ids)
+            self._entries[entry_id] = (namespace, self._normalize(vector), answer, expires_at)
+            self._namespaces.setdefault(namespace, {})[entry_id] = None
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._namespaces.clear()
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
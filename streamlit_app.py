@@ -166,24 +166,25 @@ if uploaded_file:
 
 # 响应生成
 if st.button("Generate Response"):
-    with st.spinner("Generating response..."):
-        # 添加进度条
-        progress_bar = st.progress(0)
-        for percent_complete in range(100):
-            progress_bar.progress(percent_complete + 1)
-        
-        if uploaded_file:
-            # RAG功能
-            file_path = f"{uploaded_file.name}"
-            with open(file_path, "wb") as f:
-                f.write(uploaded_file.getbuffer())
-            response = agent.llm_tool_dispatcher(prompt, file_path)
+    st.markdown("### Response:")
+    placeholder = st.empty()
+    file_path = None
+    if uploaded_file:
+        # RAG功能
+        file_path = f"{uploaded_file.name}"
+        with open(file_path, "wb") as f:
+            f.write(uploaded_file.getbuffer())
+    try:
+        with st.spinner("Generating response..."):
+            tokens = agent.llm_tool_dispatcher(prompt, file_path, stream=True)
+            # 等待首个片段时显示spinner
+            first = next(tokens, "")
+        # 逐片段刷新样式化的聊天气泡
+        response = first
+        placeholder.markdown(f'<div class="stChatMessage">{response}</div>', unsafe_allow_html=True)
+        for token in tokens:
+            response += token
+            placeholder.markdown(f'<div class="stChatMessage">{response}</div>', unsafe_allow_html=True)
+    finally:
+        if file_path:
             os.remove(file_path)  # 处理后清理临时文件
-        else:
-            # 直接生成响应
-            response = agent.llm_tool_dispatcher(prompt)
-
-        # 显示响应在样式化的聊天气泡中
-        st.markdown("### Response:")
-        with st.container():
-            st.markdown(f'<div class="stChatMessage">{response}</div>', unsafe_allow_html=True)
\ No newline at end of file
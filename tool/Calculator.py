@@ -1,10 +1,36 @@
 import re
 from .base_tool import Tool
-from typing import Union
+from .expression import _safe_pow, compile_expression
+from functools import reduce
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Union
 import operator
 
 class Calculator(Tool):
-    """计算器工具，支持基本数学运算和表达式解析"""
+    """计算器工具，支持四则运算、乘方、括号、常用数学函数和变量"""
+
+    parameters = {
+        "type": "object",
+        "properties": {
+            "expression": {"type": "string", "description": "要计算的数学表达式，例如 (3+5)*2 或 sqrt(x)+1"},
+            "variables": {"type": "object", "description": "表达式中变量的取值，可以是数字或数字列表"},
+        },
+        "required": ["expression"],
+    }
+    # 只有数字和运算符的输入可能是日期、电话号码等（如"2024-01-01"），必须带有"计算"或"等于/="等提示
+    route_patterns = [
+        r"(?:请|帮我)?(?:计算|算一下|算算)\s*"
+        r"(?P<expression>[-+(（\s]*\d*\.?\d+[)）\s]*"
+        r"(?:[-+*/^×÷]\s*[-+(（\s]*\d*\.?\d+[)）\s]*)+)"
+        r"(?:等于|是)?(?:多少|几)?\s*=?\s*[?？。]?",
+        r"(?:请|帮我)?"
+        r"(?P<expression>[-+(（\s]*\d*\.?\d+[)）\s]*"
+        r"(?:[-+*/^×÷]\s*[-+(（\s]*\d*\.?\d+[)）\s]*)+)"
+        r"(?:=|等于(?:多少|几)?|是多少|是几)\s*[?？。]?",
+    ]
+    result_formatter = "计算结果为 {result}"
+    timeout = 5.0
+    cache_policy = "pure"
+    cpu_heavy = True  # 长串大数连乘等计算可能长时间占用CPU
     
     def __init__(self):
         super().__init__(name="calculator")
@@ -14,12 +40,12 @@ class Calculator(Tool):
             '-': operator.sub,
             '*': operator.mul,
             '/': operator.truediv,
-            '^': operator.pow,
+            '^': _safe_pow,  # 与表达式求值共用结果大小检查
             'add': operator.add,
             'subtract': operator.sub,
             'multiply': operator.mul,
             'divide': operator.truediv,
-            'power': operator.pow
+            'power': _safe_pow
         }
 
     def _execute(self, *args, **kwargs) -> Union[float, int]:
@@ -30,37 +56,79 @@ class Calculator(Tool):
         - 表达式字符串: "5+3"
         - 直接参数: (5, '+', 3)
         - 字典参数: {'numbers': [5, 3], 'operation': '+'}
+        - 函数调用参数: {'expression': '5+3'}
+        - 带变量的表达式: {'expression': 'price*qty', 'variables': {'price': 2.5, 'qty': [1, 2, 3]}}，
+          变量为列表时按列向量化计算，返回结果列表
+        - 批量表达式: {'expressions': ['1+2', '3*4']}，返回结果列表
         - 关键字参数: num1=5, num2=3, operation='+'
         """
         # 如果是单个字符串参数，尝试解析为表达式
         if len(args) == 1 and isinstance(args[0], str) and not kwargs:
             return self._evaluate_expression(args[0])
+        if len(args) == 1 and isinstance(args[0], dict) and 'expressions' in args[0]:
+            return self.evaluate_many(args[0]['expressions'], args[0].get('variables'))
+        if len(args) == 1 and isinstance(args[0], dict) and 'expression' in args[0]:
+            variables = args[0].get('variables')
+            if variables and any(not self._is_scalar(value) for value in variables.values()):
+                return self.evaluate_vectorized(str(args[0]['expression']), variables).tolist()
+            return self._evaluate_expression(str(args[0]['expression']), variables)
             
         # 否则按原逻辑处理
         numbers, operation = self._parse_arguments(*args, **kwargs)
         return self._compute(numbers, operation)
 
-    def _evaluate_expression(self, expr: str) -> Union[float, int]:
-        """计算数学表达式"""
-        # 移除所有空白字符
-        expr = re.sub(r'\s+', '', expr)
-        
-        # 使用正则表达式匹配数字和运算符
-        pattern = r'([-+]?\d*\.?\d+)([-+*/^])([-+]?\d*\.?\d+)'
-        match = re.fullmatch(pattern, expr)
-        
-        if not match:
-            raise ValueError(f"无效的数学表达式: {expr}")
-            
-        num1, op, num2 = match.groups()
-        
-        try:
-            num1 = float(num1) if '.' in num1 else int(num1)
-            num2 = float(num2) if '.' in num2 else int(num2)
-        except ValueError:
-            raise ValueError("表达式包含无效数字")
-            
-        return self._compute([num1, num2], op)
+    def normalize_params(self, params):
+        """表达式去掉多余空白，字符串和{'expression': ...}两种写法共用缓存；数组变量转为列表"""
+        if isinstance(params, dict) and 'expression' in params and len(params) == 1:
+            params = str(params['expression'])
+        if isinstance(params, str):
+            # 保留两个标识符/数字之间的空白，避免"a b"与"ab"共用缓存
+            return re.sub(r'(?<!\w)\s+|\s+(?!\w)', '', params)
+        if isinstance(params, dict) and isinstance(params.get('variables'), dict):
+            variables = {name: value.tolist() if hasattr(value, 'tolist') else value
+                         for name, value in params['variables'].items()}
+            params = dict(params, variables=variables)
+        return params
+
+    @staticmethod
+    def _is_scalar(value: Any) -> bool:
+        return isinstance(value, (int, float)) or getattr(value, 'ndim', None) == 0
+
+    def _evaluate_expression(self, expr: str, variables: Optional[Mapping[str, Any]] = None) -> Union[float, int]:
+        """计算数学表达式，编译结果按表达式文本缓存"""
+        return compile_expression(expr).evaluate(variables)
+
+    def evaluate_many(self, expressions: Sequence[str],
+                      variables: Optional[Mapping[str, Any]] = None) -> List[Union[float, int, str]]:
+        """
+        批量计算多个表达式，相同的表达式只解析和计算一次
+        Args:
+            expressions: 表达式列表
+            variables: 所有表达式共用的变量取值
+        Returns:
+            与输入顺序一致的结果列表，计算失败的表达式对应错误说明
+        """
+        results: Dict[str, Union[float, int, str]] = {}
+        for expr in expressions:
+            expr = str(expr)
+            if expr in results:
+                continue
+            try:
+                results[expr] = self._evaluate_expression(expr, variables)
+            except (ValueError, ZeroDivisionError) as e:
+                results[expr] = f"计算失败: {e}"
+        return [results[str(expr)] for expr in expressions]
+
+    def evaluate_vectorized(self, expression: str, variables: Mapping[str, Any]):
+        """
+        对变量的整列取值向量化计算同一个表达式（需要NumPy），例如对数千行数据套用同一公式
+        Args:
+            expression: 表达式，例如 price*qty*(1-discount)
+            variables: 变量名 -> 数字或数字序列，按NumPy广播规则对齐
+        Returns:
+            numpy.ndarray，除以零得到inf、超出定义域得到nan
+        """
+        return compile_expression(expression).evaluate_vectorized(variables)
 
     def _compute(self, numbers: list, operation: str) -> Union[float, int]:
         """执行实际计算"""
@@ -68,10 +136,7 @@ class Calculator(Tool):
             raise ValueError(f"不支持的操作: {operation}")
             
         try:
-            result = numbers[0]
-            for num in numbers[1:]:
-                result = self.operations[operation](result, num)
-            return result
+            return reduce(self.operations[operation], numbers)
         except ZeroDivisionError:
             raise ZeroDivisionError("不能除以零")
         except Exception as e:
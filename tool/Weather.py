@@ -1,12 +1,182 @@
 from .base_tool   import Tool
+from .cities import is_city
+import asyncio
+import re
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Sequence, Tuple, Union
 import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_BASE_URL = "http://api.tangdouz.com/tq.php"
+FAILED_PREFIX = "查询失败: "
+
+_TIME = r"(?:今天|明天|后天|现在|目前)"
+# 地名后必须紧跟（可带"市"和时间词）"天气"，前面只允许查询类动词和时间词
+_ROUTE_RE = re.compile(
+    rf"(?:请|帮我)*(?P<ask>查询|查一下|查查|查)?{_TIME}?"
+    rf"(?P<city>[\u4e00-\u9fa5]{{2,8}}?)市?{_TIME}?的?天气(?:怎么样|如何|情况|预报)?[?？。!！]?"
+)
+# 不在城市表中的地名只在明确"查询"时采用，且不能含时间、指示和疑问类的字词
+_NOT_CITY_RE = re.compile(
+    r"[这那哪几今明后昨本下上]|现在|目前|最近|周|星期|礼拜|什么|怎|如何|为|的|种|样|天"
+)
+
+
+def match_route(prompt: str) -> Optional[Dict[str, str]]:
+    """
+    天气请求的快速路由规则
+    Args:
+        prompt: 去除首尾空白的用户输入
+    Returns:
+        工具参数，不是明确的城市天气查询时返回None，交给LLM判断
+    """
+    m = _ROUTE_RE.fullmatch(prompt)
+    if m is None:
+        return None
+    city = m.group("city")
+    if is_city(city) or (m.group("ask") and not _NOT_CITY_RE.search(city)):
+        return {"city": city}
+    return None
+
+
 @Tool.register("weather")
 class Weather(Tool):
     "可以执行天气查询"
-    def __init__(self):
+    parameters = {
+        "type": "object",
+        "properties": {"city": {"type": "string", "description": "要查询天气的城市，例如 北京"}},
+        "required": ["city"],
+    }
+    # 只有已知城市或明确"查询X天气"才直接路由，"下周天气怎么样"、"我讨厌这种天气"等交给LLM判断
+    route_patterns = [match_route]
+    timeout = 10.0
+    cache_policy = "ttl"
+    cache_ttl = 300.0
+
+    def __init__(self, base_url: str = DEFAULT_BASE_URL,
+                 request_timeout: Tuple[float, float] = (3.05, 8.0), pool_size: int = 16):
+        """
+        初始化天气工具
+        Args:
+            base_url: 天气接口地址，城市通过dz参数传入
+            request_timeout: (连接超时, 读取超时)秒
+            pool_size: 连接池大小，同时也是批量查询的并发数
+        """
         super().__init__("天气查询")
-    def _execute(self, city,*args):
-        url =f"http://api.tangdouz.com/tq.php?dz={city}"
-        response =requests.get(url)
-        return response.text.replace(r"\r","\n")
-    
\ No newline at end of file
+        self.base_url = base_url
+        self.request_timeout = request_timeout
+        self.pool_size = pool_size
+        # 客户端在首次使用时创建，之后复用keep-alive连接
+        self._session: Optional[requests.Session] = None
+        # 异步客户端的连接绑定在事件循环上，每个事件循环一个客户端，事件循环被回收时随之释放
+        self._aclients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    @property
+    def session(self) -> requests.Session:
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._session = session
+        return self._session
+
+    @property
+    def aclient(self):
+        """当前事件循环的异步客户端(httpx.AsyncClient)，首次在该事件循环中使用时创建"""
+        loop = asyncio.get_running_loop()
+        client = self._aclients.get(loop)
+        if client is None:
+            import httpx
+            connect, read = self.request_timeout
+            client = self._aclients[loop] = httpx.AsyncClient(
+                timeout=httpx.Timeout(read, connect=connect),
+                limits=httpx.Limits(max_connections=self.pool_size,
+                                    max_keepalive_connections=self.pool_size),
+            )
+        return client
+
+    @staticmethod
+    def _text(text: str) -> str:
+        return text.replace(r"\r","\n")
+
+    def cacheable(self, result) -> bool:
+        # 批量查询中有城市失败时不缓存，避免错误说明在有效期内被重复返回
+        if isinstance(result, dict):
+            return not any(str(value).startswith(FAILED_PREFIX) for value in result.values())
+        return True
+
+    def normalize_params(self, params):
+        if isinstance(params, dict) and 'cities' in params:
+            return [str(city).strip() for city in params['cities']]
+        if isinstance(params, dict) and 'city' in params:
+            params = params['city']
+        return str(params).strip()
+
+    def _execute(self, city, *args) -> Union[str, Dict[str, str]]:
+        """
+        查询天气
+        支持: 城市名字符串、{'city': 城市}、批量查询{'cities': [城市, ...]}
+        """
+        if isinstance(city, dict) and 'cities' in city:
+            return self.fetch_many(city['cities'])
+        if isinstance(city, dict):
+            city = city["city"]
+        return self.fetch(city)
+
+    async def _aexecute(self, city, *args) -> Union[str, Dict[str, str]]:
+        if isinstance(city, dict) and 'cities' in city:
+            return await self.afetch_many(city['cities'])
+        if isinstance(city, dict):
+            city = city["city"]
+        return await self.afetch(city)
+
+    def fetch(self, city: str) -> str:
+        response = self.session.get(self.base_url, params={"dz": city}, timeout=self.request_timeout)
+        response.raise_for_status()
+        return self._text(response.text)
+
+    async def afetch(self, city: str) -> str:
+        response = await self.aclient.get(self.base_url, params={"dz": city})
+        response.raise_for_status()
+        return self._text(response.text)
+
+    def fetch_many(self, cities: Sequence[str]) -> Dict[str, str]:
+        """
+        通过连接池并发查询多个城市
+        Returns:
+            城市 -> 天气，查询失败的城市对应错误说明
+        """
+        cities = list(dict.fromkeys(cities))
+        if not cities:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(self.pool_size, len(cities))) as pool:
+            futures = {city: pool.submit(self.fetch, city) for city in cities}
+        results = {}
+        for city, future in futures.items():
+            error = future.exception()
+            results[city] = f"{FAILED_PREFIX}{error}" if error is not None else future.result()
+        return results
+
+    async def afetch_many(self, cities: Sequence[str]) -> Dict[str, str]:
+        """fetch_many的异步版本"""
+        cities = list(dict.fromkeys(cities))
+        results = await asyncio.gather(*(self.afetch(city) for city in cities), return_exceptions=True)
+        return {city: f"{FAILED_PREFIX}{result}" if isinstance(result, Exception) else result
+                for city, result in zip(cities, results)}
+
+    def close(self) -> None:
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    async def aclose(self) -> None:
+        """关闭当前事件循环的异步客户端"""
+        client = self._aclients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
@@ -1,5 +1,6 @@
 # tool/__init__.py
 from .base_tool import Tool
 from .Calculator import Calculator
+from .registry import ToolRegistry
 
-__all__ = ['Tool', 'Calculator']
\ No newline at end of file
+__all__ = ['Tool', 'Calculator', 'ToolRegistry']
\ No newline at end of file
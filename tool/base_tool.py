@@ -1,13 +1,89 @@
 # tool/base.py
+import itertools
+from typing import Any, Callable, Dict, List, Optional, Union
+
+
 class Tool:
     _tools = {}  # 工具注册表
     _descriptions = {}  # 工具描述注册表
+    _instance_ids = itertools.count(1)
+
+    # 函数调用(function calling)模式下提供给模型的描述，为空时使用类docstring首行
+    description: str = ""
+    # 参数的JSON Schema，子类按需覆盖；默认接收一个字符串input
+    parameters: Dict[str, Any] = {
+        "type": "object",
+        "properties": {"input": {"type": "string", "description": "工具输入"}},
+        "required": ["input"],
+    }
+    # 快速路由规则：完整匹配用户输入的正则（命名分组即为工具参数），或接收输入、返回工具参数
+    # （不匹配时返回None）的函数，匹配时跳过LLM意图分析
+    route_patterns: List[Union[str, Callable[[str], Optional[Any]]]] = []
+    # 本地结果格式化：str.format模板（可用{result}、{query}、{params}）或
+    # callable(result, query, params)，设置后调度器不再调用LLM格式化结果
+    result_formatter: Optional[Union[str, Callable[..., str]]] = None
+    # 单次执行的超时时间（秒），None表示不限时
+    timeout: Optional[float] = 30.0
+    # 结果缓存策略：never（不缓存）| pure（相同参数结果不变，一直缓存）| ttl（缓存cache_ttl秒）
+    CACHE_POLICIES = ("never", "pure", "ttl")
+    cache_policy: str = "never"
+    cache_ttl: Optional[float] = None
+    # CPU密集或可能失控的工具，代理配置了进程池(ToolProcessPool)时在子进程中隔离执行，实例和参数需可pickle
+    cpu_heavy: bool = False
 
     def __init__(self, name: str):
         self.name = name
 
         self._active = False
 
+    def schema(self, name: str) -> Dict[str, Any]:
+        """
+        生成chat API的function calling工具定义
+        Args:
+            name: 工具在代理中注册的名称
+        Returns:
+            {"type": "function", "function": {...}}格式的工具定义
+        """
+        description = self.description or (
+            self.__doc__.strip().splitlines()[0] if self.__doc__ else "无描述"
+        )
+        return {
+            "type": "function",
+            "function": {"name": name, "description": description, "parameters": self.parameters},
+        }
+
+    def format_result(self, result: Any, query: str, params: Any = None) -> Optional[str]:
+        """
+        用本地格式化器把结果转为回复
+        Args:
+            result: 工具执行结果
+            query: 用户原始问题
+            params: 工具参数
+        Returns:
+            格式化后的回复，未设置格式化器时返回None
+        """
+        if self.result_formatter is None:
+            return None
+        if callable(self.result_formatter):
+            return self.result_formatter(result, query, params)
+        return self.result_formatter.format(result=result, query=query, params=params)
+
+    def cacheable(self, result: Any) -> bool:
+        """结果是否可以写入结果缓存，默认均可；含失败项的批量结果等应返回False"""
+        return True
+
+    def normalize_params(self, params: Any) -> Any:
+        """规范化参数作为结果缓存的key，默认合并字符串中的连续空白"""
+        if isinstance(params, str):
+            return " ".join(params.split())
+        return params
+
+    def from_arguments(self, arguments: Dict[str, Any]) -> Any:
+        """把模型返回的函数参数转为use()的输入，默认schema下直接传入input字段"""
+        if self.parameters is Tool.parameters:
+            return arguments.get("input")
+        return arguments
+
     @classmethod
     def register(cls, name):
         def wrapper(tool_cls):
@@ -32,6 +108,30 @@ class Tool:
     def _execute(self, *args, **kwargs):
         raise NotImplementedError("子类必须实现此方法")
 
+    async def ause(self, *args, **kwargs):
+        """use的异步版本，仅在子类实现了_aexecute时可用"""
+        self._active = True
+        try:
+            return await self._aexecute(*args, **kwargs)
+        finally:
+            self._active = False
+
+    async def _aexecute(self, *args, **kwargs):
+        raise NotImplementedError("子类未实现异步执行")
+
+    @property
+    def instance_id(self) -> int:
+        """实例的唯一编号，结果缓存以此区分同名工具的新旧实例"""
+        instance_id = self.__dict__.get("_instance_id")
+        if instance_id is None:
+            instance_id = self.__dict__.setdefault("_instance_id", next(Tool._instance_ids))
+        return instance_id
+
+    @property
+    def supports_async(self) -> bool:
+        """是否原生支持异步执行，否则异步调用方需在线程池中执行use"""
+        return type(self)._aexecute is not Tool._aexecute
+
     @property
     def is_active(self):
         return self._active
\ No newline at end of file
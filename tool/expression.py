@@ -0,0 +1,344 @@
+"""
+数学表达式引擎：把表达式解析为语法树并编译为Python字节码，编译结果按表达式文本缓存
+
+支持 + - * / // % ^(**)、括号、一元正负号、常量(pi, e, tau)、函数调用和变量，
+同一个编译结果既可以对单组变量求值，也可以用NumPy对整列变量向量化求值
+"""
+import keyword
+import math
+import numbers
+import re
+from functools import lru_cache, reduce
+from types import CodeType
+from typing import Any, Dict, FrozenSet, List, Mapping, Optional, Tuple, Union
+
+Number = Union[int, float]
+
+MAX_EXPRESSION_LENGTH = 4096
+# 整数乘方结果的最大位数，超过时拒绝计算，避免9^9^9这类表达式耗尽CPU和内存
+MAX_INT_BITS = 4096
+
+_TOKEN = re.compile(r"""
+    \s*(?:
+        (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)
+      | (?P<name>[A-Za-z_]\w*)
+      | (?P<op>\*\*|//|[-+*/%^(),])
+    )""", re.VERBOSE)
+# 中文输入中常见的全角符号
+_TRANSLATE = str.maketrans({"×": "*", "÷": "/", "（": "(", "）": ")", "，": ",", "－": "-", "＋": "+"})
+
+CONSTANTS: Dict[str, float] = {"pi": math.pi, "e": math.e, "tau": math.tau}
+
+
+def _safe_pow(base: Number, exponent: Number) -> Number:
+    if (isinstance(base, int) and isinstance(exponent, int) and exponent > 0 and abs(base) > 1
+            and exponent * math.log2(abs(base)) > MAX_INT_BITS):
+        raise ValueError("计算结果过大")
+    result = base ** exponent
+    if isinstance(result, complex):
+        raise ValueError("计算结果不是实数")
+    return result
+
+
+def _log(x: Number, base: Optional[Number] = None) -> float:
+    return math.log(x) if base is None else math.log(x, base)
+
+
+# 函数名 -> (标量实现, 最少参数数, 最多参数数，None表示不限)
+_SCALAR_FUNCTIONS: Dict[str, Tuple[Any, int, Optional[int]]] = {
+    "abs": (abs, 1, 1),
+    "sqrt": (math.sqrt, 1, 1),
+    "exp": (math.exp, 1, 1),
+    "log": (_log, 1, 2),
+    "ln": (math.log, 1, 1),
+    "log10": (math.log10, 1, 1),
+    "log2": (math.log2, 1, 1),
+    "sin": (math.sin, 1, 1),
+    "cos": (math.cos, 1, 1),
+    "tan": (math.tan, 1, 1),
+    "asin": (math.asin, 1, 1),
+    "acos": (math.acos, 1, 1),
+    "atan": (math.atan, 1, 1),
+    "floor": (math.floor, 1, 1),
+    "ceil": (math.ceil, 1, 1),
+    "round": (round, 1, 2),
+    "pow": (_safe_pow, 2, 2),
+    "min": (min, 1, None),
+    "max": (max, 1, None),
+}
+FUNCTIONS: FrozenSet[str] = frozenset(_SCALAR_FUNCTIONS)
+
+_SCALAR_NAMESPACE: Dict[str, Any] = {name: spec[0] for name, spec in _SCALAR_FUNCTIONS.items()}
+_SCALAR_NAMESPACE.update(CONSTANTS, _pow=_safe_pow, __builtins__={})
+_vector_namespace: Optional[Dict[str, Any]] = None
+
+
+def _get_vector_namespace() -> Dict[str, Any]:
+    """NumPy实现的函数表，首次向量化求值时才导入NumPy"""
+    global _vector_namespace
+    if _vector_namespace is None:
+        import numpy as np
+
+        def power(base, exponent):
+            return np.power(np.asarray(base, dtype=float), exponent)
+
+        def log(x, base=None):
+            return np.log(x) if base is None else np.log(x) / np.log(base)
+
+        namespace = {
+            "abs": np.abs, "sqrt": np.sqrt, "exp": np.exp, "log": log, "ln": np.log,
+            "log10": np.log10, "log2": np.log2, "sin": np.sin, "cos": np.cos, "tan": np.tan,
+            "asin": np.arcsin, "acos": np.arccos, "atan": np.arctan,
+            "floor": np.floor, "ceil": np.ceil, "round": np.round, "pow": power,
+            "min": lambda *args: reduce(np.minimum, args),
+            "max": lambda *args: reduce(np.maximum, args),
+        }
+        namespace.update(CONSTANTS, _pow=power, __builtins__={})
+        _vector_namespace = namespace
+    return _vector_namespace
+
+
+class _Parser:
+    """递归下降解析器，语法树节点为元组: ("num", 值) ("var", 名称) ("neg"/"pos", 子节点)
+    ("bin", 运算符, 左, 右) ("call", 函数名, 参数列表)"""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.tokens = self._tokenize(text)
+        self.pos = 0
+
+    @staticmethod
+    def _tokenize(text: str) -> List[Tuple[str, str]]:
+        tokens = []
+        pos = 0
+        end = len(text.rstrip())
+        while pos < end:
+            match = _TOKEN.match(text, pos)
+            if not match:
+                raise ValueError(f"无效的数学表达式: 无法识别位置 {pos} 处的 {text[pos:pos + 10]!r}")
+            kind = match.lastgroup
+            tokens.append((kind, match.group(kind)))
+            pos = match.end()
+        return tokens
+
+    def _peek(self) -> Optional[str]:
+        return self.tokens[self.pos][1] if self.pos < len(self.tokens) else None
+
+    def _next(self) -> Tuple[str, str]:
+        if self.pos >= len(self.tokens):
+            raise ValueError(f"无效的数学表达式: {self.text} 不完整")
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def _expect(self, value: str) -> None:
+        kind, token = self._next()
+        if token != value:
+            raise ValueError(f"无效的数学表达式: 期望 {value!r}，实际为 {token!r}")
+
+    def parse(self) -> tuple:
+        if not self.tokens:
+            raise ValueError("表达式为空")
+        node = self._expression()
+        if self.pos != len(self.tokens):
+            raise ValueError(f"无效的数学表达式: 多余的 {self._peek()!r}")
+        return node
+
+    def _expression(self) -> tuple:
+        node = self._term()
+        while self._peek() in ("+", "-"):
+            op = self._next()[1]
+            node = ("bin", op, node, self._term())
+        return node
+
+    def _term(self) -> tuple:
+        node = self._unary()
+        while self._peek() in ("*", "/", "//", "%"):
+            op = self._next()[1]
+            node = ("bin", op, node, self._unary())
+        return node
+
+    def _unary(self) -> tuple:
+        if self._peek() in ("+", "-"):
+            op = self._next()[1]
+            return ("neg" if op == "-" else "pos", self._unary())
+        return self._power()
+
+    def _power(self) -> tuple:
+        node = self._atom()
+        if self._peek() in ("^", "**"):
+            self._next()
+            # 乘方右结合，且优先级高于左侧的一元负号: -2^2 = -4, 2^-1 = 0.5
+            node = ("bin", "**", node, self._unary())
+        return node
+
+    def _atom(self) -> tuple:
+        kind, token = self._next()
+        if kind == "number":
+            value = float(token) if any(c in token for c in ".eE") else int(token)
+            if value == math.inf:
+                raise ValueError(f"数字过大: {token}")
+            return ("num", value)
+        if kind == "name":
+            if self._peek() == "(":
+                return self._call(token)
+            if token in FUNCTIONS:
+                raise ValueError(f"函数 {token} 缺少参数列表")
+            if token.startswith("_") or keyword.iskeyword(token):
+                raise ValueError(f"无效的变量名: {token}")
+            return ("var", token)
+        if token == "(":
+            node = self._expression()
+            self._expect(")")
+            return node
+        raise ValueError(f"无效的数学表达式: 意外的 {token!r}")
+
+    def _call(self, name: str) -> tuple:
+        if name not in FUNCTIONS:
+            raise ValueError(f"不支持的函数: {name}，可用函数: {sorted(FUNCTIONS)}")
+        self._expect("(")
+        args = []
+        if self._peek() != ")":
+            args.append(self._expression())
+            while self._peek() == ",":
+                self._next()
+                args.append(self._expression())
+        self._expect(")")
+        _, min_args, max_args = _SCALAR_FUNCTIONS[name]
+        if len(args) < min_args or (max_args is not None and len(args) > max_args):
+            raise ValueError(f"函数 {name} 的参数个数不正确: {len(args)}")
+        return ("call", name, args)
+
+
+def _to_source(node: tuple) -> str:
+    """语法树转为完全加括号的Python表达式，名称均已在解析时校验"""
+    kind = node[0]
+    if kind == "num":
+        return repr(node[1])
+    if kind == "var":
+        return node[1]
+    if kind == "neg":
+        return f"(-{_to_source(node[1])})"
+    if kind == "pos":
+        return f"(+{_to_source(node[1])})"
+    if kind == "call":
+        return f"{node[1]}({', '.join(_to_source(arg) for arg in node[2])})"
+    _, op, left, right = node
+    if op == "**":
+        return f"_pow({_to_source(left)}, {_to_source(right)})"
+    return f"({_to_source(left)} {op} {_to_source(right)})"
+
+
+def _variables(node: tuple) -> FrozenSet[str]:
+    kind = node[0]
+    if kind == "var":
+        return frozenset() if node[1] in CONSTANTS else frozenset([node[1]])
+    if kind in ("neg", "pos"):
+        return _variables(node[1])
+    if kind == "call":
+        return frozenset().union(*(_variables(arg) for arg in node[2]))
+    if kind == "bin":
+        return _variables(node[2]) | _variables(node[3])
+    return frozenset()
+
+
+class CompiledExpression:
+    """编译后的表达式，可重复求值，线程安全"""
+
+    def __init__(self, expression: str, source: str, code: CodeType, variables: FrozenSet[str]):
+        self.expression = expression
+        self.source = source
+        self.variables = variables
+        self._code = code
+
+    def __repr__(self) -> str:
+        return f"CompiledExpression({self.expression!r})"
+
+    def _bindings(self, variables: Optional[Mapping[str, Any]]) -> Dict[str, Any]:
+        variables = dict(variables or {})
+        missing = self.variables - variables.keys()
+        if missing:
+            raise ValueError(f"表达式 {self.expression} 缺少变量: {sorted(missing)}")
+        return {name: variables[name] for name in self.variables}
+
+    def evaluate(self, variables: Optional[Mapping[str, Any]] = None) -> Number:
+        """
+        对一组变量求值
+        Args:
+            variables: 变量名 -> 数值
+        Returns:
+            计算结果，整数运算保持为int
+        Raises:
+            ValueError: 缺少变量或计算错误时
+            ZeroDivisionError: 除以零时
+        """
+        bindings = self._bindings(variables)
+        for name, value in bindings.items():
+            if isinstance(value, bool) or not isinstance(value, numbers.Real):
+                raise ValueError(f"变量 {name} 必须是数字，获取 {type(value).__name__}")
+        try:
+            return eval(self._code, _SCALAR_NAMESPACE, bindings)
+        except ZeroDivisionError:
+            raise ZeroDivisionError("不能除以零")
+        except (ArithmeticError, ValueError, TypeError) as e:
+            raise ValueError(f"计算错误: {str(e)}")
+
+    def evaluate_vectorized(self, variables: Optional[Mapping[str, Any]] = None):
+        """
+        用NumPy对整列变量求值，变量按NumPy广播规则对齐
+        按浮点数计算：除以零得到inf，超出定义域得到nan，不抛出异常
+        Args:
+            variables: 变量名 -> 数值或数组
+        Returns:
+            numpy.ndarray，形状为各变量广播后的形状
+        """
+        import numpy as np
+
+        bindings = {}
+        for name, value in self._bindings(variables).items():
+            array = np.asarray(value)
+            if array.dtype.kind not in "biuf":
+                raise ValueError(f"变量 {name} 必须是数值数组，获取 {array.dtype}")
+            bindings[name] = array
+        try:
+            shape = np.broadcast_shapes(*(array.shape for array in bindings.values()))
+        except ValueError:
+            raise ValueError(f"变量的形状无法对齐: { {name: a.shape for name, a in bindings.items()} }")
+        with np.errstate(all="ignore"):
+            result = eval(self._code, _get_vector_namespace(), bindings)
+        return np.broadcast_to(np.asarray(result, dtype=float), shape).copy()
+
+
+@lru_cache(maxsize=1024)
+def _compile(expression: str) -> CompiledExpression:
+    try:
+        tree = _Parser(expression).parse()
+        source = _to_source(tree)
+        code = compile(source, "<expression>", "eval")
+    except RecursionError:
+        raise ValueError("表达式嵌套过深")
+    return CompiledExpression(expression, source, code, _variables(tree))
+
+
+def compile_expression(expression: str) -> CompiledExpression:
+    """
+    解析并编译表达式，相同文本的表达式只编译一次
+    Raises:
+        ValueError: 表达式无效时
+    """
+    if not isinstance(expression, str):
+        raise ValueError(f"表达式必须是字符串，获取 {type(expression).__name__}")
+    expression = expression.translate(_TRANSLATE).strip()
+    if len(expression) > MAX_EXPRESSION_LENGTH:
+        raise ValueError(f"表达式过长（超过 {MAX_EXPRESSION_LENGTH} 个字符）")
+    return _compile(expression)
+
+
+def evaluate(expression: str, variables: Optional[Mapping[str, Any]] = None) -> Number:
+    """编译（或取缓存）并求值"""
+    return compile_expression(expression).evaluate(variables)
+
+
+def cache_info():
+    """编译缓存的命中统计"""
+    return _compile.cache_info()
@@ -0,0 +1,404 @@
+"""
+进程隔离的工具执行池：CPU密集或可能失控的工具在常驻子进程中执行，
+每次调用有墙钟超时，子进程有内存上限，超时、被取消或崩溃的子进程会被终止并替换
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import pickle
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .base_tool import Tool
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerTimeoutError(TimeoutError):
+    """工具在子进程中执行超时，子进程已被终止"""
+    pass
+
+
+class WorkerCrashedError(RuntimeError):
+    """子进程在执行工具时异常退出（例如超出内存限制被系统终止）"""
+    pass
+
+
+def _worker_main(conn, memory_limit: Optional[int]) -> None:
+    """子进程主循环：接收(工具, 参数)，执行后返回(是否成功, 结果或异常)，收到空消息时退出"""
+    # 并行度由进程数提供，避免每个子进程再各自创建一组BLAS线程
+    for name in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ.setdefault(name, "1")
+    if memory_limit:
+        try:
+            import resource
+            resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+        except (ImportError, ValueError, OSError) as e:
+            logger.warning(f"无法设置工具进程的内存上限: {str(e)}")
+    conn.send_bytes(b"ready")
+    while True:
+        try:
+            message = conn.recv_bytes()
+        except (EOFError, OSError):
+            return
+        if not message:
+            return
+        try:
+            tool, params = pickle.loads(message)
+            reply = (True, tool.use(params))
+        except BaseException as e:
+            reply = (False, e)
+        try:
+            payload = pickle.dumps(reply)
+        except Exception as e:
+            payload = pickle.dumps((False, RuntimeError(f"工具结果无法序列化: {str(e)}")))
+        conn.send_bytes(payload)
+        if not reply[0] and isinstance(reply[1], MemoryError):
+            # 内存耗尽后进程状态不可靠，退出后由池替换
+            return
+
+
+class _Worker:
+    def __init__(self, context, memory_limit: Optional[int]):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, memory_limit),
+                                       name="tool-worker", daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.tasks = 0
+
+    def wait_ready(self, timeout: float) -> None:
+        """等待子进程完成导入和初始化"""
+        try:
+            if self.conn.poll(timeout) and self.conn.recv_bytes() == b"ready":
+                return
+        except (EOFError, OSError):
+            pass
+        self.kill()
+        raise WorkerCrashedError(f"工具进程未能在 {timeout} 秒内启动（退出码 {self.process.exitcode}）")
+
+    def kill(self) -> None:
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(timeout=1)
+        self.conn.close()
+
+    def stop(self) -> None:
+        try:
+            self.conn.send_bytes(b"")
+        except OSError:
+            pass
+        self.process.join(timeout=1)
+        self.kill()
+
+
+class ToolProcessPool:
+    """
+    常驻子进程组成的工具执行池
+    工具实例和参数通过pickle发送到空闲子进程执行，调用方线程只等待管道，不占用GIL；
+    超时、被取消或崩溃时终止该子进程并补充新进程，其他调用不受影响
+    """
+
+    STARTUP_TIMEOUT = 30.0
+
+    def __init__(self, workers: int = 2, memory_limit_mb: Optional[int] = 1024,
+                 max_tasks_per_worker: Optional[int] = 500, start_method: str = "spawn"):
+        """
+        初始化进程池，子进程在首次调用或start()时创建
+        Args:
+            workers: 子进程数，即最大并行执行数
+            memory_limit_mb: 每个子进程的地址空间上限（MB），None表示不限制，仅POSIX系统生效
+            max_tasks_per_worker: 子进程执行多少次后替换为新进程，None表示不替换
+            start_method: multiprocessing启动方式，spawn不继承父进程的线程和锁，最安全
+        """
+        if workers < 1:
+            raise ValueError(f"进程数必须大于0，获取 {workers}")
+        self.workers = workers
+        self.memory_limit = memory_limit_mb * 1024 * 1024 if memory_limit_mb else None
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self._context = multiprocessing.get_context(start_method)
+        self._idle: List[_Worker] = []
+        self._size = 0  # 已创建或正在创建的子进程数
+        self._cond = threading.Condition()
+        # 等待空闲子进程的协程：(事件循环, future)，子进程归还时从归还线程唤醒
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+        self._closed = False
+        self._stats = {"calls": 0, "errors": 0, "timeouts": 0, "cancelled": 0, "crashes": 0, "recycled": 0}
+
+    def start(self) -> "ToolProcessPool":
+        """预先创建全部子进程并等待其就绪，避免首次调用承担进程启动的耗时"""
+        with self._cond:
+            missing = 0 if self._closed else self.workers - self._size
+            self._size += max(missing, 0)
+        threads = [threading.Thread(target=self._spawn, daemon=True) for _ in range(missing)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self
+
+    def _spawn(self) -> None:
+        """创建子进程并放入空闲队列，调用前已在_size中占位"""
+        try:
+            worker = _Worker(self._context, self.memory_limit)
+            worker.wait_ready(self.STARTUP_TIMEOUT)
+        except BaseException:
+            with self._cond:
+                self._size -= 1
+                self._notify()
+            raise
+        with self._cond:
+            if self._closed:
+                self._size -= 1
+                worker.stop()
+                return
+            self._idle.append(worker)
+            self._notify()
+
+    def _notify(self) -> None:
+        """有子进程空闲或占位释放时唤醒等待方，调用时需持有_cond"""
+        self._cond.notify()
+        self._wake_async_waiters()
+
+    def _wake_async_waiters(self) -> None:
+        # 唤醒全部等待的协程，由它们重新竞争，避免唤醒已超时或被取消的协程导致通知丢失
+        waiters, self._async_waiters = self._async_waiters, []
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(lambda future=future: future.done() or future.set_result(None))
+            except RuntimeError:  # 事件循环已关闭
+                pass
+
+    def _try_acquire(self, waiter: Optional[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = None
+                     ) -> Tuple[Optional[_Worker], bool]:
+        """
+        取一个空闲子进程
+        Args:
+            waiter: 没有可用子进程时登记的协程等待方，与检查在同一把锁内完成，不会错过通知
+        Returns:
+            (子进程, 是否需要由调用方创建新进程)
+        """
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("工具进程池已关闭")
+            if self._idle:
+                return self._idle.pop(), False
+            if self._size < self.workers:
+                self._size += 1
+                return None, True
+            if waiter is not None:
+                self._async_waiters.append(waiter)
+            return None, False
+
+    def _acquire(self, deadline: Optional[float]) -> _Worker:
+        while True:
+            worker, spawn = self._try_acquire()
+            if worker is not None:
+                return worker
+            if spawn:
+                self._spawn()
+                continue
+            with self._cond:
+                if self._idle or self._closed or self._size < self.workers:
+                    continue
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise WorkerTimeoutError("等待空闲工具进程超时")
+                self._cond.wait(remaining)
+
+    def _release(self, worker: _Worker, healthy: bool) -> None:
+        """归还子进程；不健康或达到执行次数上限的子进程被替换"""
+        worker.tasks += 1
+        recycle = healthy and self.max_tasks_per_worker and worker.tasks >= self.max_tasks_per_worker
+        if healthy and not recycle and worker.process.is_alive():
+            with self._cond:
+                if not self._closed:
+                    self._idle.append(worker)
+                    self._notify()
+                    return
+        with self._cond:
+            self._stats["recycled"] += 1
+        # 在后台结束旧进程并立即补充新进程，调用方无需等待；新进程沿用旧进程的占位
+        threading.Thread(target=self._replace, args=(worker, recycle), daemon=True).start()
+
+    def _replace(self, worker: _Worker, graceful: bool) -> None:
+        if graceful:
+            worker.stop()
+        else:
+            worker.kill()
+        with self._cond:
+            if self._closed:
+                self._size -= 1
+                self._notify()
+                return
+        try:
+            self._spawn()
+        except Exception as e:
+            if not self._closed:
+                logger.error(f"补充工具进程失败: {str(e)}")
+
+    def _count(self, name: str) -> None:
+        with self._cond:
+            self._stats[name] += 1
+
+    @staticmethod
+    def _dumps(tool: Tool, params: Any) -> bytes:
+        try:
+            return pickle.dumps((tool, params))
+        except Exception as e:
+            raise ValueError(f"工具 {tool.name} 或其参数无法发送到子进程: {str(e)}")
+
+    def _result(self, worker: _Worker) -> Tuple[Any, bool]:
+        """
+        读取子进程返回的结果
+        Returns:
+            (结果, 子进程是否可继续使用)
+        Raises:
+            子进程中工具抛出的异常；WorkerCrashedError: 子进程异常退出时
+        """
+        try:
+            ok, value = pickle.loads(worker.conn.recv_bytes())
+        except (EOFError, OSError):
+            self._count("crashes")
+            worker.process.join(timeout=1)
+            raise WorkerCrashedError(f"工具进程异常退出（退出码 {worker.process.exitcode}），"
+                                     f"可能超出了内存上限")
+        if ok:
+            return value, True
+        self._count("errors")
+        if isinstance(value, MemoryError):
+            raise MemoryError("工具执行超出内存上限")
+        raise value
+
+    def run(self, tool: Tool, params: Any, timeout: Optional[float] = None) -> Any:
+        """
+        在子进程中执行tool.use(params)
+        Args:
+            tool: 工具实例，需可pickle
+            params: 工具参数，需可pickle
+            timeout: 墙钟超时（秒），包括等待空闲子进程的时间；None表示不限时
+        Returns:
+            工具执行结果
+        Raises:
+            WorkerTimeoutError: 超时，执行中的子进程已被终止
+            WorkerCrashedError: 子进程异常退出
+        """
+        payload = self._dumps(tool, params)
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        worker = self._acquire(deadline)
+        healthy = False
+        try:
+            self._count("calls")
+            worker.conn.send_bytes(payload)
+            remaining = max(deadline - time.monotonic(), 0) if deadline is not None else None
+            if not worker.conn.poll(remaining):
+                self._count("timeouts")
+                logger.warning(f"工具 {tool.name} 执行超时（{timeout}秒），终止工具进程 {worker.process.pid}")
+                raise WorkerTimeoutError(f"工具 {tool.name} 执行超时（{timeout}秒）")
+            result, healthy = self._result(worker)
+            return result
+        except (WorkerTimeoutError, WorkerCrashedError, MemoryError):
+            raise
+        except Exception:
+            healthy = worker.process.is_alive()
+            raise
+        finally:
+            self._release(worker, healthy)
+
+    async def arun(self, tool: Tool, params: Any, timeout: Optional[float] = None) -> Any:
+        """run的异步版本，等待期间不占用事件循环线程；任务被取消时终止执行中的子进程"""
+        payload = self._dumps(tool, params)
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            waiter = (loop, loop.create_future())
+            worker, spawn = self._try_acquire(waiter)
+            if worker is not None:
+                break
+            if spawn:
+                await loop.run_in_executor(None, self._spawn)
+                continue
+            remaining = deadline - time.monotonic() if deadline is not None else None
+            try:
+                if remaining is None or remaining > 0:
+                    # 由_release/_spawn通过call_soon_threadsafe唤醒
+                    await asyncio.wait([waiter[1]], timeout=remaining)
+            finally:
+                with self._cond:
+                    if waiter in self._async_waiters:
+                        self._async_waiters.remove(waiter)
+            if not waiter[1].done() and deadline is not None and time.monotonic() >= deadline:
+                self._count("timeouts")
+                raise WorkerTimeoutError("等待空闲工具进程超时")
+
+        healthy = False
+        try:
+            self._count("calls")
+            worker.conn.send_bytes(payload)
+            remaining = max(deadline - time.monotonic(), 0) if deadline is not None else None
+            try:
+                ready = await self._wait_readable(loop, worker, remaining)
+            except asyncio.CancelledError:
+                self._count("cancelled")
+                raise
+            if not ready:
+                self._count("timeouts")
+                logger.warning(f"工具 {tool.name} 执行超时（{timeout}秒），终止工具进程 {worker.process.pid}")
+                raise WorkerTimeoutError(f"工具 {tool.name} 执行超时（{timeout}秒）")
+            result, healthy = self._result(worker)
+            return result
+        except (WorkerTimeoutError, WorkerCrashedError, MemoryError, asyncio.CancelledError):
+            raise
+        except Exception:
+            healthy = worker.process.is_alive()
+            raise
+        finally:
+            self._release(worker, healthy)
+
+    @staticmethod
+    async def _wait_readable(loop: asyncio.AbstractEventLoop, worker: _Worker,
+                             timeout: Optional[float]) -> bool:
+        """
+        等待子进程返回结果
+        POSIX上把管道注册到事件循环；Windows的事件循环不支持监听管道（ProactorEventLoop
+        没有add_reader），改为在线程中等待，任务被取消后子进程被终止，线程随之返回
+        Returns:
+            结果是否已就绪，超时返回False
+        """
+        if sys.platform == "win32":
+            return await loop.run_in_executor(None, worker.conn.poll, timeout)
+        readable = loop.create_future()
+        fd = worker.conn.fileno()
+        loop.add_reader(fd, lambda: readable.done() or readable.set_result(None))
+        try:
+            await asyncio.wait_for(readable, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            loop.remove_reader(fd)
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return dict(self._stats, workers=self._size, idle=len(self._idle))
+
+    def shutdown(self) -> None:
+        """关闭进程池，空闲子进程正常退出，执行中的调用结束后其子进程被终止"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+            self._wake_async_waiters()
+        for worker in idle:
+            worker.stop()
+
+    def __enter__(self) -> "ToolProcessPool":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.shutdown()
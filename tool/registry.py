@@ -0,0 +1,133 @@
+import threading
+from functools import cached_property
+from types import MappingProxyType
+from typing import Any, Dict, FrozenSet, List, Mapping, Optional, Type, TypeVar
+
+from .base_tool import Tool
+
+T = TypeVar('T', bound=Tool)
+
+
+class RegistrySnapshot:
+    """
+    工具注册表某一版本的只读快照
+    工具清单、意图分析的prompt片段和function calling定义在每个版本首次使用时计算一次
+    """
+
+    def __init__(self, version: int, tools: Dict[str, Tool], core: FrozenSet[str]):
+        self.version = version
+        self.tools: Mapping[str, Tool] = MappingProxyType(tools)
+        self.core = core
+
+    @cached_property
+    def manifest(self) -> Dict[str, str]:
+        """工具清单（名称: 描述）"""
+        return {
+            name: tool.__doc__.split('\n')[0].strip() if tool.__doc__ else "无描述"
+            for name, tool in self.tools.items()
+        }
+
+    @cached_property
+    def prompt_fragment(self) -> str:
+        """意图分析prompt中的工具列表"""
+        return "\n".join(
+            f"- {name}: {tool.__doc__.splitlines()[0] if tool.__doc__ else '无描述'}"
+            for name, tool in self.tools.items()
+        )
+
+    @cached_property
+    def schemas(self) -> List[Dict[str, Any]]:
+        """function calling工具定义，调用方不应修改"""
+        return [tool.schema(name) for name, tool in self.tools.items()]
+
+
+class ToolRegistry:
+    """
+    线程安全的版本化工具注册表
+    注册和卸载在锁内复制当前工具表、生成新版本快照后整体替换（copy-on-write），
+    读取只需获取当前快照的引用，不加锁，并发调度时始终看到一致的某个版本
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = RegistrySnapshot(0, {}, frozenset())
+
+    @property
+    def snapshot(self) -> RegistrySnapshot:
+        return self._snapshot
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._snapshot.tools
+
+    def __len__(self) -> int:
+        return len(self._snapshot.tools)
+
+    def register(self, name: str, tool_instance: Tool, *,
+                 is_core: bool = False, overwrite: bool = False) -> RegistrySnapshot:
+        """
+        注册工具
+        Args:
+            name: 工具标识名
+            tool_instance: 工具实例
+            is_core: 是否为核心工具（不可卸载）
+            overwrite: 是否允许覆盖已有工具
+        Returns:
+            注册后的新快照
+        Raises:
+            ValueError: 当工具名已存在且不允许覆盖时
+            TypeError: 当工具类型不正确时
+        """
+        if not isinstance(tool_instance, Tool):
+            raise TypeError(f"工具必须继承自Tool类，获取 {type(tool_instance)}")
+        if tool_instance.cache_policy not in Tool.CACHE_POLICIES:
+            raise ValueError(f"工具 {name} 的缓存策略 {tool_instance.cache_policy} 无效，"
+                             f"可选 {Tool.CACHE_POLICIES}")
+        with self._lock:
+            current = self._snapshot
+            if name in current.tools and not overwrite:
+                if name in current.core and not is_core:
+                    raise ValueError(f"核心工具 {name} 不能被非核心版本覆盖")
+                raise ValueError(f"工具 {name} 已存在，使用 overwrite=True 强制覆盖")
+            tool_instance._is_core = is_core
+            tools = dict(current.tools)
+            tools[name] = tool_instance
+            core = current.core | {name} if is_core else current.core - {name}
+            self._snapshot = RegistrySnapshot(current.version + 1, tools, core)
+            return self._snapshot
+
+    def unregister(self, name: str) -> bool:
+        """
+        卸载工具
+        Returns:
+            bool: 是否成功卸载
+        Raises:
+            ValueError: 当尝试卸载核心工具时
+        """
+        with self._lock:
+            current = self._snapshot
+            if name not in current.tools:
+                return False
+            if name in current.core:
+                raise ValueError(f"不能卸载核心工具 {name}")
+            tools = dict(current.tools)
+            del tools[name]
+            self._snapshot = RegistrySnapshot(current.version + 1, tools, current.core)
+            return True
+
+    def get(self, name: str, tool_type: Optional[Type[T]] = None) -> T:
+        """
+        获取工具实例
+        Raises:
+            ValueError: 当工具不存在或类型不匹配时
+        """
+        tools = self._snapshot.tools
+        if name not in tools:
+            raise ValueError(f"工具 {name} 未注册。可用工具: {list(tools.keys())}")
+        tool = tools[name]
+        if tool_type and not isinstance(tool, tool_type):
+            raise ValueError(f"工具 {name} 类型不符，期望 {tool_type} 但获取 {type(tool)}")
+        return tool
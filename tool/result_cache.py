@@ -0,0 +1,91 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+class ToolResultCache:
+    """
+    工具结果缓存
+    以(工具名, 工具实例编号, 规范化参数)为key，多个工具共用一个有容量上限的LRU；
+    工具被覆盖注册后，仍在执行的旧实例写入的结果不会被新实例命中；
+    条目可带有效期，pure工具的结果不过期
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        """
+        初始化结果缓存
+        Args:
+            max_entries: 最多缓存的条目数
+        """
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, int, str], Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(tool_name: str, params: Hashable, instance_id: int = 0) -> Tuple[str, int, str]:
+        """
+        生成缓存key
+        Args:
+            tool_name: 工具注册名
+            params: 规范化后的参数
+            instance_id: 工具实例编号（Tool.instance_id）
+        """
+        return tool_name, instance_id, json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+
+    def get(self, key: Tuple[str, int, str]) -> Tuple[bool, Any]:
+        """
+        查询缓存
+        Returns:
+            (是否命中, 结果)，结果本身可能为None，因此单独返回是否命中
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, entry[0]
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key: Tuple[str, int, str], result: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.time() + ttl if ttl is not None else float("inf")
+        with self._lock:
+            self._entries[key] = (result, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, tool_name: str) -> int:
+        """删除某个工具的全部缓存，工具被覆盖或卸载时调用"""
+        with self._lock:
+            keys = [key for key in self._entries if key[0] == tool_name]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)